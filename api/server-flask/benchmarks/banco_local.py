@@ -0,0 +1,198 @@
+"""Substituto local do MySQL sobre SQLite para os benchmarks.
+
+Implementa só o pedaço do mysql.connector que o server.py usa: connect(),
+cursores (inclusive dictionary=True), commit/rollback, ping e os erros
+IntegrityError/Error. As consultas são traduzidas na hora: %s vira ?, o
+DATE_FORMAT e o CURDATE viram funções registradas no SQLite e um SELECT ...
+FOR UPDATE abre a transação com BEGIN IMMEDIATE, o que serializa os escritores
+como os bloqueios de linha fariam.
+
+Não substitui um teste contra MySQL de verdade (planos de execução, locks por
+linha e rede são outros), mas dá números comparáveis entre versões do código.
+
+    import banco_local
+    banco_local.criar_esquema('/tmp/beauty.db')  # aplica migrations/
+    banco_local.instalar('/tmp/beauty.db')  # antes de importar o server
+"""
+import os
+import re
+import sqlite3
+import sys
+from datetime import date, datetime
+
+import mysql.connector
+
+DIRETORIO_SERVIDOR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if DIRETORIO_SERVIDOR not in sys.path:
+    sys.path.insert(0, DIRETORIO_SERVIDOR)
+
+import migrar
+
+# Mesmas migrações do MySQL (migrations/), com o DDL traduzido para o SQLite
+RE_AUTO_INCREMENTO = re.compile(r'\bINT NOT NULL AUTO_INCREMENT PRIMARY KEY\b', re.IGNORECASE)
+RE_OPCOES_TABELA = re.compile(r'\)\s*ENGINE\s*=.*$', re.IGNORECASE | re.DOTALL)
+RE_ADICIONAR_INDICE = re.compile(r'^ALTER TABLE (\w+) ADD (UNIQUE )?INDEX (\w+) (\(.*\))$', re.IGNORECASE | re.DOTALL)
+
+# Especificadores do DATE_FORMAT do MySQL usados pelo server.py
+FORMATOS_DATA = {'%Y': '%Y', '%m': '%m', '%d': '%d', '%H': '%H', '%i': '%M', '%s': '%S'}
+RE_LITERAL = re.compile(r"('(?:[^']|'')*')")
+RE_COMENTARIO = re.compile(r'--[^\n]*')
+RE_FOR_UPDATE = re.compile(r'\bFOR\s+UPDATE\b', re.IGNORECASE)
+RE_ESCRITA = re.compile(r'^\s*(INSERT|UPDATE|DELETE|REPLACE)\b', re.IGNORECASE)
+
+sqlite3.register_adapter(datetime, lambda valor: valor.isoformat(' '))
+sqlite3.register_adapter(date, lambda valor: valor.isoformat())
+sqlite3.register_converter('DATETIME', lambda valor: datetime.fromisoformat(valor.decode()))
+
+
+def date_format(valor, formato):
+    if valor is None:
+        return None
+    for especificador, equivalente in FORMATOS_DATA.items():
+        formato = formato.replace(especificador, equivalente)
+    return datetime.fromisoformat(valor).strftime(formato)
+
+
+def traduzir_ddl(comando):
+    indice = RE_ADICIONAR_INDICE.match(comando)
+    if indice:
+        tabela, unico, nome, colunas = indice.groups()
+        return f"CREATE {unico or ''}INDEX IF NOT EXISTS {nome} ON {tabela} {colunas}"
+    comando = RE_AUTO_INCREMENTO.sub('INTEGER PRIMARY KEY AUTOINCREMENT', comando)
+    return RE_OPCOES_TABELA.sub(')', comando)
+
+
+def traduzir(sql):
+    # %s fora de literais vira ?; dentro deles (formatos do DATE_FORMAT) fica como está
+    partes = RE_LITERAL.split(RE_COMENTARIO.sub('', sql))
+    for indice in range(0, len(partes), 2):
+        partes[indice] = partes[indice].replace('%s', '?')
+    sql = ''.join(partes)
+    para_atualizar = bool(RE_FOR_UPDATE.search(sql))
+    return RE_FOR_UPDATE.sub('', sql), para_atualizar
+
+
+def converter_erro(erro):
+    if isinstance(erro, sqlite3.IntegrityError):
+        # Mesmos códigos do MySQL: 1452 para chave estrangeira, 1062 para duplicidade
+        errno = 1452 if 'FOREIGN KEY' in str(erro) else 1062
+        return mysql.connector.IntegrityError(msg=str(erro), errno=errno)
+    if isinstance(erro, sqlite3.OperationalError):
+        return mysql.connector.OperationalError(msg=str(erro))
+    return mysql.connector.DatabaseError(msg=str(erro))
+
+
+class CursorLocal:
+    def __init__(self, conexao, dictionary=False):
+        self._conexao = conexao
+        self._cursor = conexao._sqlite.cursor()
+        self._dicionario = dictionary
+        self.lastrowid = None
+        self.rowcount = -1
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *excecao):
+        self.close()
+
+    def __iter__(self):
+        return iter(self.fetchone, None)
+
+    @property
+    def description(self):
+        return self._cursor.description
+
+    def execute(self, sql, params=()):
+        sql, para_atualizar = traduzir(sql)
+        try:
+            if not self._conexao.in_transaction:
+                if para_atualizar:
+                    self._cursor.execute('BEGIN IMMEDIATE')
+                elif RE_ESCRITA.match(sql):
+                    self._cursor.execute('BEGIN')
+            self._cursor.execute(sql, tuple(params or ()))
+        except sqlite3.Error as e:
+            raise converter_erro(e) from e
+        self.lastrowid = self._cursor.lastrowid
+        self.rowcount = self._cursor.rowcount
+
+    def executemany(self, sql, sequencia):
+        for params in sequencia:
+            self.execute(sql, params)
+
+    def _linha(self, linha):
+        if linha is None or not self._dicionario:
+            return linha
+        return {coluna[0]: valor for coluna, valor in zip(self._cursor.description, linha)}
+
+    def fetchone(self):
+        return self._linha(self._cursor.fetchone())
+
+    def fetchmany(self, size=1):
+        return [self._linha(linha) for linha in self._cursor.fetchmany(size)]
+
+    def fetchall(self):
+        return [self._linha(linha) for linha in self._cursor.fetchall()]
+
+    def close(self):
+        self._cursor.close()
+
+
+class ConexaoLocal:
+    unread_result = False
+
+    def __init__(self, caminho):
+        # Sem transação implícita: leituras em autocommit, escritas abrem BEGIN no CursorLocal
+        self._sqlite = sqlite3.connect(caminho, timeout=30, isolation_level=None,
+                                       check_same_thread=False, detect_types=sqlite3.PARSE_DECLTYPES)
+        self._sqlite.execute('PRAGMA journal_mode=WAL')
+        self._sqlite.execute('PRAGMA synchronous=NORMAL')
+        self._sqlite.execute('PRAGMA foreign_keys=ON')
+        self._sqlite.create_function('DATE_FORMAT', 2, date_format)
+        self._sqlite.create_function('CURDATE', 0, lambda: date.today().isoformat())
+
+    @property
+    def in_transaction(self):
+        return self._sqlite.in_transaction
+
+    def cursor(self, dictionary=False, buffered=None, **kwargs):
+        return CursorLocal(self, dictionary)
+
+    def commit(self):
+        self._sqlite.commit()
+
+    def rollback(self):
+        self._sqlite.rollback()
+
+    def ping(self, reconnect=False, **kwargs):
+        pass
+
+    def is_connected(self):
+        return True
+
+    def consume_results(self):
+        pass
+
+    def close(self):
+        self._sqlite.close()
+
+
+def conectar(caminho):
+    return ConexaoLocal(caminho)
+
+
+def criar_esquema(caminho):
+    connection = sqlite3.connect(caminho)
+    try:
+        for _, _, arquivo in migrar.listar_migracoes():
+            for comando in migrar.ler_comandos(arquivo):
+                connection.execute(traduzir_ddl(comando))
+        connection.commit()
+    finally:
+        connection.close()
+
+
+def instalar(caminho):
+    # Toda conexão aberta pelo server.py passa a ir para o arquivo SQLite
+    mysql.connector.connect = lambda *args, **kwargs: ConexaoLocal(caminho)
@@ -0,0 +1,385 @@
+"""Teste de carga reproduzível do server.py com banco semeado.
+
+Sobe o servidor em um processo separado, semeia um banco com volume realista
+(clientes, funcionários com FUNCIONARIO = 1 e atendimentos em status variados)
+e dispara em paralelo /Login, /Usuarios, /Ponto, /MeusAtendimentos,
+/Atendimento e /CancelarAtendimento. Ao final imprime em JSON a vazão e os
+percentis p50/p95/p99 de cada rota.
+
+Bancos:
+    local   arquivo SQLite novo a cada execução, através de banco_local.py
+            (não precisa de MySQL; padrão)
+    mysql   MySQL apontado por DB_HOST/DB_PORT/DB_USER/DB_PASSWORD/DB_NAME, com
+            o esquema aplicado por migrar.py; os dados semeados usam logins
+            com prefixo próprio e não são apagados ao final
+
+Para comparar execuções, salve uma linha de base e depois rode em modo de
+regressão, que termina com código 1 se alguma rota ficar mais lenta que a
+base além da tolerância:
+
+    python benchmarks/bench_carga.py --salvar-base base.json
+    python benchmarks/bench_carga.py --comparar base.json --tolerancia 0.2
+"""
+import argparse
+import json
+import os
+import random
+import signal
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import urllib.error
+import urllib.request
+from datetime import datetime, timedelta
+
+from bench_login import resumir
+
+DIRETORIO_SERVIDOR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+DIRETORIO_BENCHMARKS = os.path.dirname(os.path.abspath(__file__))
+
+# Executado em um processo novo: instala o banco local (se for o caso) e serve o app com threads
+CODIGO_SERVIDOR = '''
+import logging, signal, sys
+banco, caminho, porta = sys.argv[1], sys.argv[2], int(sys.argv[3])
+if banco == 'local':
+    sys.path.insert(0, sys.argv[4])
+    import banco_local
+    banco_local.instalar(caminho)
+import server
+from werkzeug.serving import run_simple
+logging.disable(logging.CRITICAL)
+signal.signal(signal.SIGTERM, lambda *_: sys.exit(0))
+run_simple('127.0.0.1', porta, server.app, threaded=True)
+'''
+
+SENHA_CARGA = 'carga-senha'
+SERVICOS = ['Corte', 'Escova', 'Manicure', 'Pedicure', 'Coloração', 'Maquiagem', 'Sobrancelha']
+PESOS_PADRAO = {
+    'POST /Login': 10,
+    'GET /Usuarios': 25,
+    'GET /MeusAtendimentos': 30,
+    'GET /Atendimento': 5,
+    'POST /Ponto': 15,
+    'PUT /CancelarAtendimento': 15,
+}
+
+
+def conectar_banco(args):
+    if args.banco == 'local':
+        import banco_local
+        banco_local.criar_esquema(args.arquivo_banco)
+        return banco_local.conectar(args.arquivo_banco)
+
+    import mysql.connector
+    return mysql.connector.connect(
+        host=os.getenv('DB_HOST'),
+        port=int(os.getenv('DB_PORT', 3306)),
+        user=os.getenv('DB_USER'),
+        password=os.getenv('DB_PASSWORD'),
+        database=os.getenv('DB_NAME', 'BEAUTY_LINK'),
+    )
+
+
+def semear(connection, args, prefixo):
+    """Insere clientes, funcionários e atendimentos; devolve os IDs usados pela carga."""
+    from werkzeug.security import generate_password_hash
+
+    gerador = random.Random(args.semente)
+    # Um único hash para todos: gerar um KDF por usuário deixaria a semeadura lenta demais
+    senha = generate_password_hash(SENHA_CARGA, method=os.getenv('METODO_HASH_SENHA', 'pbkdf2:sha256:600000'))
+
+    usuarios = [(f'Funcionário {i}', f'{prefixo}func{i}', f'{prefixo}func{i}@carga.local', senha, 1)
+                for i in range(args.funcionarios)]
+    usuarios += [(f'Cliente {i}', f'{prefixo}cli{i}', f'{prefixo}cli{i}@carga.local', senha, 0)
+                 for i in range(args.clientes)]
+    with connection.cursor() as cursor:
+        cursor.executemany('INSERT INTO USUARIO (NOME, LOGIN, EMAIL, SENHA, FUNCIONARIO) VALUES (%s, %s, %s, %s, %s)',
+                           usuarios)
+        connection.commit()
+        cursor.execute('SELECT ID_USUARIO, LOGIN, FUNCIONARIO FROM USUARIO WHERE LOGIN LIKE %s', (prefixo + '%',))
+        semeados = cursor.fetchall()
+
+    funcionarios = sorted(linha[0] for linha in semeados if linha[2])
+    clientes = sorted((linha[0], linha[1]) for linha in semeados if not linha[2])
+
+    # Horários de hora em hora, das 9h às 17h, de 60 dias atrás a 60 dias à frente, sem repetir por funcionário
+    hoje = datetime.now().replace(minute=0, second=0, microsecond=0)
+    horarios = [(funcionario, (hoje + timedelta(days=dia)).replace(hour=hora))
+                for funcionario in funcionarios for dia in range(-60, 61) for hora in range(9, 18)]
+    escolhidos = gerador.sample(horarios, min(args.atendimentos, len(horarios)))
+    atendimentos = []
+    for funcionario, inicio in escolhidos:
+        if inicio < hoje:
+            status = gerador.choices(['CADASTRADO', 'CANCELADO'], [85, 15])[0]
+        else:
+            status = gerador.choices(['CADASTRADO', 'CANCELADO'], [70, 30])[0]
+        atendimentos.append((gerador.choice(SERVICOS), inicio, inicio - timedelta(days=gerador.randrange(1, 30)),
+                             status, prefixo, funcionario, gerador.choice(clientes)[0]))
+    with connection.cursor() as cursor:
+        for posicao in range(0, len(atendimentos), 1000):
+            cursor.executemany('''
+                INSERT INTO AGENDA (TIPO_SERVICO, DATA_ATENDIMENTO, DATA_MARCACAO, STATUS_AGENDAMENTO, OBSERVACAO,
+                                    FK_ID_FUNCIONARIO, FK_ID_USUARIO_CLIENTE)
+                VALUES (%s, %s, %s, %s, %s, %s, %s)
+            ''', atendimentos[posicao:posicao + 1000])
+        connection.commit()
+        cursor.execute("SELECT ID_AGENDA FROM AGENDA WHERE OBSERVACAO = %s AND STATUS_AGENDAMENTO = 'CADASTRADO'",
+                       (prefixo,))
+        cancelaveis = [linha[0] for linha in cursor.fetchall()]
+    connection.close()
+
+    gerador.shuffle(cancelaveis)
+    return {'funcionarios': funcionarios, 'clientes': clientes, 'cancelaveis': cancelaveis}
+
+
+def iniciar_servidor(args):
+    ambiente = dict(os.environ)
+    ambiente.setdefault('DB_MODO', 'pool')
+    processo = subprocess.Popen(
+        [sys.executable, '-c', CODIGO_SERVIDOR, args.banco, args.arquivo_banco or '', str(args.porta), DIRETORIO_BENCHMARKS],
+        cwd=DIRETORIO_SERVIDOR, env=ambiente, stdout=subprocess.DEVNULL, start_new_session=True,
+    )
+    limite = time.monotonic() + 60
+    while time.monotonic() < limite:
+        if processo.poll() is not None:
+            raise RuntimeError(f'servidor terminou ao iniciar (código {processo.returncode})')
+        try:
+            with urllib.request.urlopen(f'http://127.0.0.1:{args.porta}/', timeout=1):
+                return processo
+        except OSError:
+            time.sleep(0.2)
+    parar_servidor(processo)
+    raise RuntimeError('servidor não respondeu em 60 segundos')
+
+
+def parar_servidor(processo):
+    processo.terminate()
+    try:
+        processo.wait(10)
+    except subprocess.TimeoutExpired:
+        # Leva junto os processos do pool de hash
+        os.killpg(processo.pid, signal.SIGKILL)
+        processo.wait()
+
+
+def requisitar(url, metodo='GET', dados=None):
+    corpo = json.dumps(dados).encode('utf-8') if dados is not None else None
+    pedido = urllib.request.Request(url, data=corpo, method=metodo, headers={'Content-Type': 'application/json'})
+    inicio = time.perf_counter()
+    try:
+        with urllib.request.urlopen(pedido, timeout=60) as resposta:
+            resposta.read()
+            status = resposta.status
+    except urllib.error.HTTPError as e:
+        e.read()
+        status = e.code
+    except urllib.error.URLError:
+        status = 0
+    return status, time.perf_counter() - inicio
+
+
+class GeradorCarga:
+    """Monta a próxima requisição de cada rota a partir dos dados semeados."""
+
+    def __init__(self, dados, semente):
+        self.dados = dados
+        self._gerador = random.Random(semente)
+        self._lock = threading.Lock()
+        self._proximo_horario = 0
+        # Novos agendamentos caem em um ano distante e livre, um horário diferente por requisição
+        self._base_horarios = datetime(2100 + random.Random(semente).randrange(800), 1, 1)
+
+    def _novo_horario(self):
+        with self._lock:
+            posicao = self._proximo_horario
+            self._proximo_horario += 1
+        funcionarios = self.dados['funcionarios']
+        funcionario = funcionarios[posicao % len(funcionarios)]
+        slot = posicao // len(funcionarios)
+        inicio = self._base_horarios + timedelta(days=slot // 9, hours=9 + slot % 9)
+        return funcionario, inicio
+
+    def requisicao(self, rota):
+        with self._lock:
+            cliente, login = self._gerador.choice(self.dados['clientes'])
+            cancelar = self.dados['cancelaveis'].pop() if rota == 'PUT /CancelarAtendimento' and self.dados['cancelaveis'] else None
+
+        if rota == 'POST /Login':
+            return 'POST', '/Login', {'usuario': login, 'senha': SENHA_CARGA}
+        if rota == 'GET /Usuarios':
+            return 'GET', f'/Usuarios?id={cliente}', None
+        if rota == 'GET /MeusAtendimentos':
+            return 'GET', f'/MeusAtendimentos?id_usuario={cliente}', None
+        if rota == 'GET /Atendimento':
+            return 'GET', '/Atendimento', None
+        if rota == 'POST /Ponto':
+            funcionario, inicio = self._novo_horario()
+            return 'POST', '/Ponto', {
+                'tipo_servico': 'Carga',
+                'data_atendimento': inicio.strftime('%Y-%m-%d %H:%M'),
+                'data_marcacao': datetime.now().strftime('%Y-%m-%d %H:%M'),
+                'status_agendamento': 'CADASTRADO',
+                'observacao': 'bench_carga',
+                'fk_id_funcionario': funcionario,
+                'fk_id_usuario_cliente': cliente,
+            }
+        if rota == 'PUT /CancelarAtendimento':
+            # Acabados os semeados, repete um ID: a rota continua exercitando o UPDATE
+            return 'PUT', '/CancelarAtendimento', {'id': cancelar or self.dados['ultimo_cancelado']}
+        raise ValueError(f'rota desconhecida: {rota}')
+
+
+def executar_carga(args, dados, duracao, semente):
+    rotas = list(args.pesos)
+    pesos = [args.pesos[rota] for rota in rotas]
+    gerador = GeradorCarga(dados, semente)
+    resultados = {rota: ([], []) for rota in rotas}
+    lock = threading.Lock()
+    fim = time.monotonic() + duracao
+
+    def cliente(indice):
+        sorteio = random.Random(semente * 1000 + indice)
+        while time.monotonic() < fim:
+            rota = sorteio.choices(rotas, pesos)[0]
+            metodo, caminho, corpo = gerador.requisicao(rota)
+            status, latencia = requisitar(args.url + caminho, metodo, corpo)
+            with lock:
+                resultados[rota][0].append(latencia)
+                resultados[rota][1].append(status)
+
+    inicio = time.monotonic()
+    threads = [threading.Thread(target=cliente, args=(i,)) for i in range(args.concorrencia)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    decorrido = time.monotonic() - inicio
+
+    total_latencias = [latencia for latencias, _ in resultados.values() for latencia in latencias]
+    total_status = [status for _, status in resultados.values() for status in status]
+    return {
+        'total': resumir(total_latencias, total_status, decorrido),
+        'rotas': {rota: resumir(*resultados[rota], decorrido) for rota in rotas if resultados[rota][0]},
+    }
+
+
+def comparar(atual, base, metrica, tolerancia, folga_ms):
+    """Lista as rotas cuja métrica piorou mais que a tolerância em relação à base."""
+    comparacao = {}
+    regressoes = []
+    for rota, medicao in atual['rotas'].items():
+        referencia = base['rotas'].get(rota, {}).get(metrica)
+        valor = medicao.get(metrica)
+        if referencia is None or valor is None:
+            continue
+        limite = referencia * (1 + tolerancia) + folga_ms
+        comparacao[rota] = {
+            'base_ms': referencia,
+            'atual_ms': valor,
+            'variacao': round(valor / referencia - 1, 3) if referencia else None,
+            'limite_ms': round(limite, 2),
+        }
+        if valor > limite:
+            regressoes.append(rota)
+    return comparacao, regressoes
+
+
+def ler_pesos(valores):
+    if not valores:
+        return dict(PESOS_PADRAO)
+    pesos = {}
+    for valor in valores:
+        rota, _, peso = valor.rpartition('=')
+        if rota not in PESOS_PADRAO:
+            raise SystemExit(f'rota desconhecida em --pesos: {rota!r} (use uma de {", ".join(PESOS_PADRAO)})')
+        pesos[rota] = float(peso)
+    return {rota: peso for rota, peso in pesos.items() if peso > 0}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--banco', choices=['local', 'mysql'], default='local')
+    parser.add_argument('--arquivo-banco', help='arquivo SQLite do banco local (padrão: temporário)')
+    parser.add_argument('--url', help='servidor já em execução; se omitido, sobe um em --porta')
+    parser.add_argument('--porta', type=int, default=5077)
+    parser.add_argument('--clientes', type=int, default=2000)
+    parser.add_argument('--funcionarios', type=int, default=40)
+    parser.add_argument('--atendimentos', type=int, default=30000)
+    parser.add_argument('--semente', type=int, default=42)
+    parser.add_argument('--concorrencia', type=int, default=16, help='clientes HTTP simultâneos')
+    parser.add_argument('--duracao', type=float, default=20, help='segundos medidos')
+    parser.add_argument('--aquecimento', type=float, default=3, help='segundos de carga descartados antes da medição')
+    parser.add_argument('--pesos', nargs='+', metavar='ROTA=PESO',
+                        help='proporção de cada rota na carga, ex.: "GET /Atendimento=0" "POST /Login=20"')
+    parser.add_argument('--salvar-base', help='grava o resultado como linha de base neste arquivo')
+    parser.add_argument('--comparar', help='arquivo de linha de base; falha se alguma rota regredir')
+    parser.add_argument('--metrica', default='p95_ms', choices=['p50_ms', 'p95_ms', 'p99_ms', 'media_ms'])
+    parser.add_argument('--tolerancia', type=float, default=0.2, help='piora relativa aceita (0.2 = 20%%)')
+    parser.add_argument('--folga-ms', type=float, default=1.0, help='piora absoluta sempre aceita, contra ruído em rotas rápidas')
+    args = parser.parse_args()
+    args.pesos = ler_pesos(args.pesos)
+
+    diretorio_temporario = None
+    if args.banco == 'local' and not args.arquivo_banco:
+        diretorio_temporario = tempfile.TemporaryDirectory(prefix='bench_carga_')
+        args.arquivo_banco = os.path.join(diretorio_temporario.name, 'beauty_link.db')
+    elif args.banco == 'local' and os.path.exists(args.arquivo_banco):
+        os.remove(args.arquivo_banco)
+
+    prefixo = 'carga' if args.banco == 'local' else f'carga{int(time.time())}_'
+    inicio = time.perf_counter()
+    dados = semear(conectar_banco(args), args, prefixo)
+    dados['ultimo_cancelado'] = dados['cancelaveis'][0] if dados['cancelaveis'] else 0
+    semeadura = time.perf_counter() - inicio
+
+    processo = None
+    if not args.url:
+        processo = iniciar_servidor(args)
+        args.url = f'http://127.0.0.1:{args.porta}'
+    try:
+        if args.aquecimento > 0:
+            executar_carga(args, dados, args.aquecimento, args.semente + 1)
+        resultado = executar_carga(args, dados, args.duracao, args.semente)
+    finally:
+        if processo:
+            parar_servidor(processo)
+        if diretorio_temporario:
+            diretorio_temporario.cleanup()
+
+    relatorio = {
+        'banco': args.banco,
+        'url': args.url,
+        'volume': {'clientes': args.clientes, 'funcionarios': args.funcionarios, 'atendimentos': args.atendimentos},
+        'semente': args.semente,
+        'concorrencia': args.concorrencia,
+        'duracao_s': args.duracao,
+        'semeadura_s': round(semeadura, 2),
+        **resultado,
+    }
+
+    codigo_saida = 0
+    if args.comparar:
+        with open(args.comparar, encoding='utf-8') as arquivo:
+            base = json.load(arquivo)
+        comparacao, regressoes = comparar(resultado, base, args.metrica, args.tolerancia, args.folga_ms)
+        relatorio['regressao'] = {
+            'base': args.comparar,
+            'metrica': args.metrica,
+            'tolerancia': args.tolerancia,
+            'rotas': comparacao,
+            'regrediram': regressoes,
+        }
+        codigo_saida = 1 if regressoes else 0
+
+    if args.salvar_base:
+        with open(args.salvar_base, 'w', encoding='utf-8') as arquivo:
+            json.dump(relatorio, arquivo, indent=2, ensure_ascii=False)
+
+    print(json.dumps(relatorio, indent=2, ensure_ascii=False))
+    sys.exit(codigo_saida)
+
+
+if __name__ == '__main__':
+    main()
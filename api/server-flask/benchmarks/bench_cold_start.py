@@ -0,0 +1,79 @@
+"""Benchmark de importação e cold start do server.py.
+
+Cada repetição roda em um processo Python novo, como uma instância serverless
+recém-criada, e mede o tempo de importação do módulo, o tempo até a primeira
+resposta de GET / e até a primeira resposta de uma rota que usa o banco.
+
+Cenários:
+    ansioso     importa e abre todas as conexões do pool logo em seguida (comportamento antigo)
+    pool        pool criado sob demanda (DB_MODO=pool)
+    serverless  conexão única reaproveitada (DB_MODO=serverless)
+
+Aponte DB_HOST/DB_PORT/DB_USER/DB_PASSWORD/DB_NAME para um MySQL local com o
+esquema do BEAUTY_LINK, por exemplo:
+
+    docker run -d --name beauty-mysql -e MYSQL_ROOT_PASSWORD=root -e MYSQL_DATABASE=BEAUTY_LINK -p 3306:3306 mysql:8
+    DB_HOST=127.0.0.1 DB_USER=root DB_PASSWORD=root python benchmarks/bench_cold_start.py --usuario 1
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+DIRETORIO_SERVIDOR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Executado em um processo novo; imprime os tempos medidos em JSON
+CODIGO_INSTANCIA = '''
+import json, logging, sys, time
+inicio = time.perf_counter()
+import server
+importado = time.perf_counter()
+logging.disable(logging.CRITICAL)
+if sys.argv[1] == 'ansioso':
+    # O pool abre conexões sob demanda: o comportamento antigo é abrir todas na importação
+    server.obter_pool().aquecer(server.DB_POOL_SIZE)
+cliente = server.app.test_client()
+status_home = cliente.get('/').status_code
+home = time.perf_counter()
+status_banco = cliente.get('/Usuarios?id=' + sys.argv[2]).status_code
+banco = time.perf_counter()
+print(json.dumps({
+    'importacao_ms': (importado - inicio) * 1000,
+    'primeira_resposta_ms': (home - inicio) * 1000,
+    'primeira_consulta_ms': (banco - inicio) * 1000,
+    'status': [status_home, status_banco],
+}))
+'''
+
+
+def executar_instancia(cenario, usuario):
+    ambiente = dict(os.environ)
+    ambiente['DB_MODO'] = 'serverless' if cenario == 'serverless' else 'pool'
+    saida = subprocess.run([sys.executable, '-c', CODIGO_INSTANCIA, cenario, str(usuario)],
+                           cwd=DIRETORIO_SERVIDOR, env=ambiente, capture_output=True, text=True, check=True)
+    return json.loads(saida.stdout.strip().splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--usuario', default='1', help='ID_USUARIO existente para GET /Usuarios')
+    parser.add_argument('--repeticoes', type=int, default=10)
+    parser.add_argument('--cenarios', nargs='+', default=['ansioso', 'pool', 'serverless'])
+    args = parser.parse_args()
+
+    resultado = {}
+    for cenario in args.cenarios:
+        medicoes = [executar_instancia(cenario, args.usuario) for _ in range(args.repeticoes)]
+        resultado[cenario] = {
+            metrica: round(statistics.median(m[metrica] for m in medicoes), 2)
+            for metrica in ('importacao_ms', 'primeira_resposta_ms', 'primeira_consulta_ms')
+        }
+        resultado[cenario]['status'] = medicoes[-1]['status']
+
+    print(json.dumps({'repeticoes': args.repeticoes, 'medianas': resultado}, indent=2))
+
+
+if __name__ == '__main__':
+    main()
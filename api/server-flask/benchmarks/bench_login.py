@@ -0,0 +1,108 @@
+"""Benchmark de login sob carga mista.
+
+Dispara logins concorrentes contra um servidor em execução e, ao mesmo tempo,
+requisições a outras rotas, medindo a vazão do /Login e a latência das demais.
+Para comparar antes/depois, rode o servidor com HASH_WORKERS=0 (hash na thread
+da requisição, comportamento antigo) e depois com HASH_WORKERS>0:
+
+    HASH_WORKERS=0 python server.py                # antes
+    python benchmarks/bench_login.py --usuario ana --senha segredo
+
+    HASH_WORKERS=4 python server.py                # depois
+    python benchmarks/bench_login.py --usuario ana --senha segredo
+
+Use um servidor com threads (ex.: `flask --app server run --with-threads` ou
+gunicorn com --threads) para que as rotas compitam pelo mesmo processo.
+"""
+import argparse
+import json
+import statistics
+import threading
+import time
+import urllib.error
+import urllib.request
+
+
+def requisitar(url, dados=None):
+    corpo = json.dumps(dados).encode('utf-8') if dados is not None else None
+    pedido = urllib.request.Request(url, data=corpo, method='POST' if dados is not None else 'GET',
+                                    headers={'Content-Type': 'application/json'})
+    inicio = time.perf_counter()
+    try:
+        with urllib.request.urlopen(pedido, timeout=30) as resposta:
+            resposta.read()
+            status = resposta.status
+    except urllib.error.HTTPError as e:
+        status = e.code
+    except urllib.error.URLError:
+        status = 0
+    return status, time.perf_counter() - inicio
+
+
+def percentil(valores, p):
+    if not valores:
+        return None
+    ordenados = sorted(valores)
+    return ordenados[min(len(ordenados) - 1, int(round(p / 100 * (len(ordenados) - 1))))]
+
+
+def resumir(latencias, status, duracao):
+    return {
+        'requisicoes': len(latencias),
+        'por_segundo': round(len(latencias) / duracao, 2),
+        'status': {str(codigo): status.count(codigo) for codigo in sorted(set(status))},
+        'p50_ms': round(percentil(latencias, 50) * 1000, 2) if latencias else None,
+        'p95_ms': round(percentil(latencias, 95) * 1000, 2) if latencias else None,
+        'p99_ms': round(percentil(latencias, 99) * 1000, 2) if latencias else None,
+        'media_ms': round(statistics.mean(latencias) * 1000, 2) if latencias else None,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--url', default='http://127.0.0.1:5000')
+    parser.add_argument('--usuario', required=True)
+    parser.add_argument('--senha', required=True)
+    parser.add_argument('--clientes-login', type=int, default=8)
+    parser.add_argument('--clientes-outras', type=int, default=4)
+    parser.add_argument('--rotas', nargs='+', default=['/'],
+                        help='Rotas GET usadas como carga de fundo (ex.: / /Usuarios?id=1)')
+    parser.add_argument('--duracao', type=float, default=15, help='segundos')
+    args = parser.parse_args()
+
+    resultados = {'login': ([], []), 'outras': ([], [])}
+    lock = threading.Lock()
+    fim = time.monotonic() + args.duracao
+
+    def cliente_login():
+        while time.monotonic() < fim:
+            status, latencia = requisitar(args.url + '/Login', {'usuario': args.usuario, 'senha': args.senha})
+            with lock:
+                resultados['login'][0].append(latencia)
+                resultados['login'][1].append(status)
+
+    def cliente_outras(indice):
+        rota = args.rotas[indice % len(args.rotas)]
+        while time.monotonic() < fim:
+            status, latencia = requisitar(args.url + rota)
+            with lock:
+                resultados['outras'][0].append(latencia)
+                resultados['outras'][1].append(status)
+
+    threads = [threading.Thread(target=cliente_login) for _ in range(args.clientes_login)]
+    threads += [threading.Thread(target=cliente_outras, args=(i,)) for i in range(args.clientes_outras)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    print(json.dumps({
+        'url': args.url,
+        'duracao_s': args.duracao,
+        'login': resumir(*resultados['login'], args.duracao),
+        'outras_rotas': resumir(*resultados['outras'], args.duracao),
+    }, indent=2))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,99 @@
+"""Benchmark de vazão: POST /Ponto/lote contra N chamadas a POST /Ponto.
+
+Cria a mesma quantidade de atendimentos pelos dois caminhos, em horários livres
+de um funcionário, e compara atendimentos criados por segundo. Ao final cancela
+o que foi criado pelo lote com PUT /CancelarAtendimento/lote; os criados por
+POST /Ponto não são cancelados (a rota não devolve o ID), então use um cliente
+de teste.
+
+    python benchmarks/bench_lote.py --funcionario 1 --cliente 2 --quantidade 100
+"""
+import argparse
+import json
+import random
+import time
+import urllib.error
+import urllib.request
+from datetime import datetime, timedelta
+
+
+def requisitar(url, metodo, dados):
+    pedido = urllib.request.Request(url, data=json.dumps(dados).encode('utf-8'), method=metodo,
+                                    headers={'Content-Type': 'application/json'})
+    try:
+        with urllib.request.urlopen(pedido, timeout=60) as resposta:
+            return resposta.status, json.loads(resposta.read() or b'null')
+    except urllib.error.HTTPError as e:
+        return e.code, json.loads(e.read() or b'null')
+
+
+def gerar_atendimentos(funcionario, cliente, quantidade, inicio):
+    # Um atendimento por hora, das 9h às 17h, a partir de `inicio`
+    atendimentos = []
+    dia = inicio
+    while len(atendimentos) < quantidade:
+        for hora in range(9, 18):
+            if len(atendimentos) == quantidade:
+                break
+            atendimentos.append({
+                'tipo_servico': 'Benchmark',
+                'data_atendimento': dia.replace(hour=hora).strftime('%Y-%m-%d %H:%M'),
+                'data_marcacao': datetime.now().strftime('%Y-%m-%d %H:%M'),
+                'status_agendamento': 'CADASTRADO',
+                'observacao': 'bench_lote',
+                'fk_id_funcionario': funcionario,
+                'fk_id_usuario_cliente': cliente,
+            })
+        dia += timedelta(days=1)
+    return atendimentos
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--url', default='http://127.0.0.1:5000')
+    parser.add_argument('--funcionario', type=int, required=True)
+    parser.add_argument('--cliente', type=int, required=True)
+    parser.add_argument('--quantidade', type=int, default=100)
+    parser.add_argument('--tamanho-lote', type=int, default=100, help='deve respeitar TAMANHO_MAXIMO_LOTE do servidor')
+    args = parser.parse_args()
+
+    # Datas distantes e aleatórias para não colidir com execuções anteriores
+    base = datetime(2100 + random.randrange(800), 1, 1)
+    individuais = gerar_atendimentos(args.funcionario, args.cliente, args.quantidade, base)
+    em_lote = gerar_atendimentos(args.funcionario, args.cliente, args.quantidade, base + timedelta(days=400))
+
+    inicio = time.perf_counter()
+    criados_individuais = 0
+    for atendimento in individuais:
+        status, _ = requisitar(args.url + '/Ponto', 'POST', atendimento)
+        criados_individuais += status == 201
+    duracao_individuais = time.perf_counter() - inicio
+
+    inicio = time.perf_counter()
+    ids = []
+    for posicao in range(0, len(em_lote), args.tamanho_lote):
+        _, corpo = requisitar(args.url + '/Ponto/lote', 'POST', {'atendimentos': em_lote[posicao:posicao + args.tamanho_lote]})
+        ids += [resultado['id_agenda'] for resultado in (corpo or {}).get('resultados', []) if resultado['status'] == 'criado']
+    duracao_lote = time.perf_counter() - inicio
+
+    for posicao in range(0, len(ids), args.tamanho_lote):
+        requisitar(args.url + '/CancelarAtendimento/lote', 'PUT', {'ids': ids[posicao:posicao + args.tamanho_lote]})
+
+    print(json.dumps({
+        'url': args.url,
+        'quantidade': args.quantidade,
+        'individual': {
+            'criados': criados_individuais,
+            'segundos': round(duracao_individuais, 3),
+            'por_segundo': round(criados_individuais / duracao_individuais, 2),
+        },
+        'lote': {
+            'criados': len(ids),
+            'segundos': round(duracao_lote, 3),
+            'por_segundo': round(len(ids) / duracao_lote, 2),
+        },
+    }, indent=2))
+
+
+if __name__ == '__main__':
+    main()
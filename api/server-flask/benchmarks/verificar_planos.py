@@ -0,0 +1,185 @@
+"""Verifica os planos de execução das consultas do server.py.
+
+Semeia um banco (o mesmo de bench_carga.py, com o esquema de migrations/),
+chama cada rota pelo test client do Flask registrando o SQL que o servidor
+realmente executa, com o mesmo nome usado nas métricas (rota:VERBO TABELA), e
+roda EXPLAIN em cada consulta. Termina com código 1 se alguma fizer varredura
+completa de tabela (ou de índice) ou ordenação fora do índice (filesort).
+
+    python benchmarks/verificar_planos.py                 # SQLite local
+    DB_HOST=127.0.0.1 DB_USER=root DB_PASSWORD=root \\
+        python benchmarks/verificar_planos.py --banco mysql   # MySQL migrado com migrar.py
+
+No MySQL os planos dependem das estatísticas: a verificação roda ANALYZE TABLE
+depois de semear, mas use um volume parecido com o de produção.
+"""
+import argparse
+import json
+import logging
+import os
+import re
+import sys
+import tempfile
+from datetime import date, timedelta
+
+import banco_local
+import bench_carga
+
+# Hash barato e sem pool de processos: aqui só interessa o SQL
+os.environ.setdefault('METODO_HASH_SENHA', 'pbkdf2:sha256:1000')
+os.environ.setdefault('HASH_WORKERS', '0')
+
+
+def capturar_consultas(server):
+    """Substitui CursorMedido.execute/executemany para guardar cada SQL distinto com o primeiro params visto."""
+    consultas = {}
+
+    def registrar(sql, params):
+        chave = ' '.join(sql.split())
+        if chave not in consultas:
+            consultas[chave] = (server.nome_consulta(sql), sql, params)
+
+    execute, executemany = server.CursorMedido.execute, server.CursorMedido.executemany
+
+    def execute_registrado(self, sql, *args, **kwargs):
+        registrar(sql, args[0] if args else kwargs.get('params', ()))
+        return execute(self, sql, *args, **kwargs)
+
+    def executemany_registrado(self, sql, sequencia, *args, **kwargs):
+        registrar(sql, sequencia[0] if sequencia else ())
+        return executemany(self, sql, sequencia, *args, **kwargs)
+
+    server.CursorMedido.execute = execute_registrado
+    server.CursorMedido.executemany = executemany_registrado
+    return consultas
+
+
+def exercitar_rotas(cliente, dados):
+    """Passa por todas as rotas que consultam o banco, inclusive as páginas seguintes do cursor."""
+    funcionario = dados['funcionarios'][0]
+    id_cliente, login = dados['clientes'][0]
+    amanha = date.today() + timedelta(days=1)
+    novo = {
+        'tipo_servico': 'Verificação',
+        'data_marcacao': f'{date.today()} 08:00',
+        'status_agendamento': 'CADASTRADO',
+        'fk_id_funcionario': funcionario,
+        'fk_id_usuario_cliente': id_cliente,
+    }
+    chamadas = [
+        ('POST', '/Cadastro', {'nome': 'Verificação', 'usuario': f'{login}_novo', 'email': 'v@p', 'senha': 'x'}),
+        ('POST', '/Login', {'usuario': login, 'senha': bench_carga.SENHA_CARGA}),
+        # Outro cliente: o login acima já deixou o primeiro no cache
+        ('GET', f'/Usuarios?id={dados["clientes"][1][0]}', None),
+        ('GET', f'/MeusAtendimentos?id_usuario={id_cliente}', None),
+        ('GET', f'/MeusAtendimentos?id_usuario={id_cliente}&limit=5', None),
+        ('GET', '/Atendimento', None),
+        ('GET', '/Atendimento?limit=5', None),
+        ('GET', f'/Disponibilidade?funcionario={funcionario}&dia={amanha}', None),
+        ('POST', '/Ponto', dict(novo, data_atendimento='2199-01-02 10:00')),
+        ('POST', '/Ponto/lote', {'atendimentos': [dict(novo, data_atendimento='2199-01-03 10:00'),
+                                                  dict(novo, data_atendimento='2199-01-03 14:00')]}),
+        ('PUT', '/CancelarAtendimento', {'id': dados['cancelaveis'][0]}),
+        ('PUT', '/CancelarAtendimento/lote', {'ids': dados['cancelaveis'][1:3]}),
+    ]
+    for metodo, caminho, corpo in chamadas:
+        resposta = cliente.open(caminho, method=metodo, json=corpo)
+        if resposta.status_code >= 500:
+            raise RuntimeError(f'{metodo} {caminho} respondeu {resposta.status_code}: {resposta.get_data(as_text=True)}')
+        # Segunda página: o filtro do cursor muda a consulta
+        proximo = (resposta.get_json(silent=True) or {}).get('proximo_cursor') if 'limit=' in caminho else None
+        if proximo:
+            cliente.open(f'{caminho}&after={proximo}', method=metodo)
+
+
+def problemas_sqlite(connection, sql, params):
+    with connection.cursor() as cursor:
+        cursor.execute('EXPLAIN QUERY PLAN ' + sql, params)
+        plano = [linha[3] for linha in cursor.fetchall()]
+    connection.rollback()
+    problemas = []
+    for passo in plano:
+        if passo.startswith('SCAN '):
+            problemas.append(f'varredura completa: {passo}')
+        elif passo.startswith('USE TEMP B-TREE FOR ORDER BY') or passo.startswith('USE TEMP B-TREE FOR RIGHT PART OF ORDER BY'):
+            problemas.append(f'ordenação fora do índice: {passo}')
+    return plano, problemas
+
+
+def problemas_mysql(connection, sql, params):
+    with connection.cursor(dictionary=True) as cursor:
+        cursor.execute('EXPLAIN ' + sql, params)
+        linhas = cursor.fetchall()
+    connection.rollback()
+    plano = []
+    problemas = []
+    for linha in linhas:
+        extra = linha.get('Extra') or ''
+        plano.append(f"{linha.get('table')}: type={linha.get('type')} key={linha.get('key')} {extra}".strip())
+        if linha.get('type') in ('ALL', 'index'):
+            problemas.append(f"varredura completa de {linha.get('table')} (type={linha.get('type')})")
+        if 'Using filesort' in extra:
+            problemas.append(f"ordenação fora do índice em {linha.get('table')} (Using filesort)")
+    return plano, problemas
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--banco', choices=['local', 'mysql'], default='local')
+    parser.add_argument('--arquivo-banco', help='arquivo SQLite do banco local (padrão: temporário)')
+    parser.add_argument('--clientes', type=int, default=2000)
+    parser.add_argument('--funcionarios', type=int, default=40)
+    parser.add_argument('--atendimentos', type=int, default=30000)
+    parser.add_argument('--semente', type=int, default=42)
+    parser.add_argument('--ignorar', nargs='+', default=[], metavar='NOME',
+                        help='consultas aceitas mesmo com varredura, pelo nome (ex.: "get_atendimentos:SELECT AGENDA")')
+    args = parser.parse_args()
+
+    diretorio_temporario = None
+    if args.banco == 'local':
+        if not args.arquivo_banco:
+            diretorio_temporario = tempfile.TemporaryDirectory(prefix='verificar_planos_')
+            args.arquivo_banco = os.path.join(diretorio_temporario.name, 'beauty_link.db')
+        elif os.path.exists(args.arquivo_banco):
+            os.remove(args.arquivo_banco)
+
+    prefixo = 'planos' if args.banco == 'local' else f'planos{os.getpid()}_'
+    dados = bench_carga.semear(bench_carga.conectar_banco(args), args, prefixo)
+    connection = bench_carga.conectar_banco(args)
+    if args.banco == 'local':
+        banco_local.instalar(args.arquivo_banco)
+        explicar = problemas_sqlite
+    else:
+        with connection.cursor() as cursor:
+            cursor.execute('ANALYZE TABLE USUARIO, AGENDA')
+            cursor.fetchall()
+        explicar = problemas_mysql
+
+    import server
+    logging.disable(logging.CRITICAL)
+    consultas = capturar_consultas(server)
+    exercitar_rotas(server.app.test_client(), dados)
+
+    relatorio = {}
+    falhas = []
+    repetidos = {}
+    for nome, sql, params in consultas.values():
+        if re.match(r'\s*INSERT\b', sql, re.IGNORECASE):
+            continue
+        # Mesmo nome com SQL diferente (ex.: lista completa e paginada): numera para distinguir
+        repetidos[nome] = repetidos.get(nome, 0) + 1
+        chave = nome if repetidos[nome] == 1 else f'{nome} #{repetidos[nome]}'
+        plano, problemas = explicar(connection, sql, params)
+        relatorio[chave] = {'sql': ' '.join(sql.split()), 'plano': plano, 'problemas': problemas}
+        if problemas and nome not in args.ignorar:
+            falhas.append(chave)
+    connection.close()
+    if diretorio_temporario:
+        diretorio_temporario.cleanup()
+
+    print(json.dumps({'banco': args.banco, 'consultas': relatorio, 'falhas': falhas}, indent=2, ensure_ascii=False))
+    sys.exit(1 if falhas else 0)
+
+
+if __name__ == '__main__':
+    main()
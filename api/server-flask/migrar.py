@@ -0,0 +1,105 @@
+"""Aplica as migrações de esquema em migrations/ no banco configurado.
+
+Cada arquivo NNNN_descricao.sql é uma versão; as já aplicadas ficam registradas
+na tabela SCHEMA_MIGRACOES e não rodam de novo. DDL no MySQL não é
+transacional, então a versão só é registrada depois que todos os comandos do
+arquivo passaram; um índice que já existe (banco criado antes das migrações) é
+aceito e só gera um aviso.
+
+    DB_HOST=127.0.0.1 DB_USER=root DB_PASSWORD=root python migrar.py
+    python migrar.py --status
+"""
+import argparse
+import logging
+import os
+import re
+
+import mysql.connector
+
+DIRETORIO_MIGRACOES = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'migrations')
+RE_MIGRACAO = re.compile(r'^(\d+)_\w+\.sql$')
+ERRO_INDICE_DUPLICADO = 1061
+
+logger = logging.getLogger('migrar')
+
+
+def listar_migracoes():
+    """Devolve [(versao, nome, caminho)] em ordem de versão."""
+    migracoes = []
+    for nome in os.listdir(DIRETORIO_MIGRACOES):
+        encontrado = RE_MIGRACAO.match(nome)
+        if encontrado:
+            migracoes.append((int(encontrado.group(1)), nome, os.path.join(DIRETORIO_MIGRACOES, nome)))
+    return sorted(migracoes)
+
+
+def ler_comandos(caminho):
+    # Os arquivos não têm ';' dentro de literais: basta separar por ';' e descartar comentários
+    with open(caminho, encoding='utf-8') as arquivo:
+        sql = re.sub(r'--[^\n]*', '', arquivo.read())
+    return [comando.strip() for comando in sql.split(';') if comando.strip()]
+
+
+def versoes_aplicadas(cursor):
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS SCHEMA_MIGRACOES (
+            VERSAO INT NOT NULL PRIMARY KEY,
+            NOME VARCHAR(200) NOT NULL,
+            APLICADA_EM DATETIME NOT NULL DEFAULT CURRENT_TIMESTAMP
+        )
+    ''')
+    cursor.execute('SELECT VERSAO FROM SCHEMA_MIGRACOES')
+    return {linha[0] for linha in cursor.fetchall()}
+
+
+def migrar(connection, ate=None):
+    """Aplica as migrações pendentes até a versão `ate` (todas, se None); devolve as aplicadas."""
+    aplicadas = []
+    with connection.cursor() as cursor:
+        ja_aplicadas = versoes_aplicadas(cursor)
+        for versao, nome, caminho in listar_migracoes():
+            if versao in ja_aplicadas or (ate is not None and versao > ate):
+                continue
+            logger.info(f'Aplicando {nome}')
+            for comando in ler_comandos(caminho):
+                try:
+                    cursor.execute(comando)
+                except mysql.connector.Error as e:
+                    if e.errno != ERRO_INDICE_DUPLICADO:
+                        raise
+                    logger.warning(f'{nome}: índice já existe, mantido ({e.msg})')
+            cursor.execute('INSERT INTO SCHEMA_MIGRACOES (VERSAO, NOME) VALUES (%s, %s)', (versao, nome))
+            connection.commit()
+            aplicadas.append(nome)
+    return aplicadas
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--status', action='store_true', help='só lista as migrações aplicadas e pendentes')
+    parser.add_argument('--ate', type=int, help='aplica até esta versão')
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO, format='%(message)s')
+
+    connection = mysql.connector.connect(
+        host=os.getenv('DB_HOST'),
+        port=int(os.getenv('DB_PORT', 3306)),
+        user=os.getenv('DB_USER'),
+        password=os.getenv('DB_PASSWORD'),
+        database=os.getenv('DB_NAME', 'BEAUTY_LINK'),
+    )
+    try:
+        if args.status:
+            with connection.cursor() as cursor:
+                ja_aplicadas = versoes_aplicadas(cursor)
+            for versao, nome, _ in listar_migracoes():
+                print(f"{'aplicada' if versao in ja_aplicadas else 'pendente'}  {nome}")
+            return
+        aplicadas = migrar(connection, args.ate)
+        logger.info(f"{len(aplicadas)} migração(ões) aplicada(s)" if aplicadas else 'Esquema já está atualizado')
+    finally:
+        connection.close()
+
+
+if __name__ == '__main__':
+    main()
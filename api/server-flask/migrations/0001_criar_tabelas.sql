@@ -0,0 +1,23 @@
+-- Tabelas base do BEAUTY_LINK. Em um banco que já tem as tabelas nada muda:
+-- a migração só fica registrada e as seguintes acrescentam os índices.
+CREATE TABLE IF NOT EXISTS USUARIO (
+    ID_USUARIO INT NOT NULL AUTO_INCREMENT PRIMARY KEY,
+    NOME VARCHAR(100) NOT NULL,
+    LOGIN VARCHAR(50) NOT NULL,
+    EMAIL VARCHAR(100),
+    SENHA VARCHAR(255) NOT NULL,
+    FUNCIONARIO TINYINT NOT NULL DEFAULT 0
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4;
+
+CREATE TABLE IF NOT EXISTS AGENDA (
+    ID_AGENDA INT NOT NULL AUTO_INCREMENT PRIMARY KEY,
+    TIPO_SERVICO VARCHAR(100),
+    DATA_ATENDIMENTO DATETIME NOT NULL,
+    DATA_MARCACAO DATETIME,
+    STATUS_AGENDAMENTO VARCHAR(20) NOT NULL DEFAULT 'CADASTRADO',
+    OBSERVACAO VARCHAR(255),
+    FK_ID_FUNCIONARIO INT NOT NULL,
+    FK_ID_USUARIO_CLIENTE INT NOT NULL,
+    CONSTRAINT FK_AGENDA_FUNCIONARIO FOREIGN KEY (FK_ID_FUNCIONARIO) REFERENCES USUARIO (ID_USUARIO),
+    CONSTRAINT FK_AGENDA_CLIENTE FOREIGN KEY (FK_ID_USUARIO_CLIENTE) REFERENCES USUARIO (ID_USUARIO)
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4;
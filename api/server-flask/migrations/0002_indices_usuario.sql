@@ -0,0 +1,7 @@
+-- /Login e /Cadastro: busca por LOGIN e garantia de login único.
+-- Em bancos antigos, resolva duplicados antes de aplicar:
+--     SELECT LOGIN, COUNT(*) FROM USUARIO GROUP BY LOGIN HAVING COUNT(*) > 1;
+ALTER TABLE USUARIO ADD UNIQUE INDEX UQ_USUARIO_LOGIN (LOGIN);
+
+-- Lista de funcionários (cache de nomes do /MeusAtendimentos)
+ALTER TABLE USUARIO ADD INDEX IDX_USUARIO_FUNCIONARIO (FUNCIONARIO);
@@ -0,0 +1,8 @@
+-- /MeusAtendimentos: filtro por cliente já na ordem do cursor (DATA_ATENDIMENTO, ID_AGENDA)
+ALTER TABLE AGENDA ADD INDEX IDX_AGENDA_CLIENTE_DATA (FK_ID_USUARIO_CLIENTE, DATA_ATENDIMENTO, ID_AGENDA);
+
+-- /Atendimento: cobre o filtro por status, a ordem do cursor e as colunas devolvidas
+ALTER TABLE AGENDA ADD INDEX IDX_AGENDA_STATUS_DATA (STATUS_AGENDAMENTO, DATA_ATENDIMENTO, ID_AGENDA, FK_ID_USUARIO_CLIENTE);
+
+-- /Ponto e /Disponibilidade: horários de um funcionário (índice em memória e verificação de conflito)
+ALTER TABLE AGENDA ADD INDEX IDX_AGENDA_FUNCIONARIO_DATA (FK_ID_FUNCIONARIO, DATA_ATENDIMENTO, ID_AGENDA, STATUS_AGENDAMENTO);
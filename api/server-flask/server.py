@@ -1,39 +1,1295 @@
-from flask import Flask, request, jsonify
+from flask import Flask, request, jsonify, Response, stream_with_context, g, has_request_context
 import mysql.connector
 from flask_cors import CORS, cross_origin
+import atexit
+import base64
+import bisect
+import gzip
+import itertools
 import logging
+import multiprocessing
 import os
+import queue
+import re
+import threading
 import time
-from werkzeug.security import check_password_hash
+import zlib
+from collections import OrderedDict, deque
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+from logging.handlers import QueueHandler, QueueListener
+from werkzeug.security import check_password_hash, generate_password_hash
 
 app = Flask(__name__)
 CORS(app, origins=['https://beauty-link-react.vercel.app/'], supports_credentials=True)
 
-# Configuração do banco de dados com pool de conexões
-from mysql.connector import pooling
+# Configuração de logs: as requisições só enfileiram os registros; uma thread separada escreve na saída
+LOG_LEVEL = os.getenv('LOG_LEVEL', 'INFO').upper()
+LOG_LEVEL_WERKZEUG = os.getenv('LOG_LEVEL_WERKZEUG', 'WARNING').upper()
+fila_logs = queue.SimpleQueue()
+saida_logs = logging.StreamHandler()
+saida_logs.setFormatter(logging.Formatter('%(asctime)s %(levelname)s %(name)s: %(message)s'))
+ouvinte_logs = QueueListener(fila_logs, saida_logs)
+logging.getLogger().setLevel(LOG_LEVEL)
+logging.getLogger().addHandler(QueueHandler(fila_logs))
+logging.getLogger('werkzeug').setLevel(LOG_LEVEL_WERKZEUG)
+ouvinte_logs.start()
+atexit.register(ouvinte_logs.stop)
+
+# Métricas no formato de texto do Prometheus, expostas em GET /metrics
+BUCKETS_LATENCIA = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+def escapar_label(valor):
+    return str(valor).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def formatar_labels(nomes, valores, le=None):
+    pares = [f'{nome}="{escapar_label(valor)}"' for nome, valor in zip(nomes, valores)]
+    if le is not None:
+        pares.append(f'le="{le}"')
+    return '{' + ','.join(pares) + '}' if pares else ''
+
+
+class Histograma:
+    """Histograma cumulativo por combinação de labels, como o do Prometheus."""
+
+    def __init__(self, nome, ajuda, labels, buckets=BUCKETS_LATENCIA):
+        self.nome = nome
+        self.ajuda = ajuda
+        self.labels = labels
+        self.buckets = buckets
+        self._series = {}  # valores dos labels -> [contagens por bucket, soma, total]
+        self._lock = threading.Lock()
+
+    def observar(self, valor, *labels):
+        posicao = bisect.bisect_left(self.buckets, valor)
+        with self._lock:
+            serie = self._series.get(labels)
+            if serie is None:
+                serie = self._series[labels] = [[0] * len(self.buckets), 0.0, 0]
+            if posicao < len(self.buckets):
+                serie[0][posicao] += 1
+            serie[1] += valor
+            serie[2] += 1
+
+    def exportar(self):
+        linhas = [f'# HELP {self.nome} {self.ajuda}', f'# TYPE {self.nome} histogram']
+        with self._lock:
+            series = {labels: (list(serie[0]), serie[1], serie[2]) for labels, serie in self._series.items()}
+        for labels, (contagens, soma, total) in sorted(series.items()):
+            acumulado = 0
+            for limite, contagem in zip(self.buckets, contagens):
+                acumulado += contagem
+                linhas.append(f'{self.nome}_bucket{formatar_labels(self.labels, labels, limite)} {acumulado}')
+            linhas.append(f'{self.nome}_bucket{formatar_labels(self.labels, labels, "+Inf")} {total}')
+            linhas.append(f'{self.nome}_sum{formatar_labels(self.labels, labels)} {soma}')
+            linhas.append(f'{self.nome}_count{formatar_labels(self.labels, labels)} {total}')
+        return linhas
+
+
+class Contador:
+    def __init__(self, nome, ajuda, labels):
+        self.nome = nome
+        self.ajuda = ajuda
+        self.labels = labels
+        self._valores = {}
+        self._lock = threading.Lock()
+
+    def incrementar(self, *labels):
+        with self._lock:
+            self._valores[labels] = self._valores.get(labels, 0) + 1
+
+    def exportar(self):
+        linhas = [f'# HELP {self.nome} {self.ajuda}', f'# TYPE {self.nome} counter']
+        with self._lock:
+            valores = dict(self._valores)
+        for labels, valor in sorted(valores.items()):
+            linhas.append(f'{self.nome}{formatar_labels(self.labels, labels)} {valor}')
+        return linhas
+
+
+def exportar_valor(nome, ajuda, tipo, valor):
+    # Métricas lidas na hora da coleta a partir dos contadores de outros componentes
+    return [f'# HELP {nome} {ajuda}', f'# TYPE {nome} {tipo}', f'{nome} {valor}']
+
+
+def nome_consulta(sql):
+    # "rota:VERBO TABELA", por exemplo "login:SELECT USUARIO"; mantém poucas séries por métrica
+    verbo = sql.lstrip().split(None, 1)[0].upper() if sql.strip() else '?'
+    tabela = RE_TABELA.search(sql)
+    rota = request.endpoint if has_request_context() and request.endpoint else 'interno'
+    return f"{rota}:{verbo} {tabela.group(1).upper() if tabela else '?'}"
+
+
+RE_TABELA = re.compile(r'\b(?:FROM|INTO|UPDATE)\s+`?(\w+)', re.IGNORECASE)
+
+
+class CursorMedido:
+    # Repassa tudo para o cursor real, medindo execute/executemany por consulta nomeada
 
-# Configurando o pool de conexões com pool_size reduzido e timeout para conexões ociosas
+    def __init__(self, cursor):
+        self._cursor = cursor
+
+    def __getattr__(self, nome):
+        return getattr(self._cursor, nome)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *excecao):
+        self._cursor.close()
+
+    def __iter__(self):
+        return iter(self._cursor)
+
+    @contextmanager
+    def _medir(self, sql):
+        nome = nome_consulta(sql)
+        inicio = time.perf_counter()
+        try:
+            yield
+        except Exception:
+            erros_consultas.incrementar(nome)
+            raise
+        finally:
+            latencia_consultas.observar(time.perf_counter() - inicio, nome)
+
+    def execute(self, sql, *args, **kwargs):
+        with self._medir(sql):
+            return self._cursor.execute(sql, *args, **kwargs)
+
+    def executemany(self, sql, *args, **kwargs):
+        with self._medir(sql):
+            return self._cursor.executemany(sql, *args, **kwargs)
+
+
+latencia_rotas = Histograma('beauty_http_request_duration_seconds', 'Latência das rotas HTTP.', ('rota', 'metodo', 'status'))
+latencia_consultas = Histograma('beauty_db_query_duration_seconds', 'Latência das consultas ao banco, por consulta nomeada.', ('consulta',))
+erros_consultas = Contador('beauty_db_query_errors_total', 'Consultas ao banco que falharam.', ('consulta',))
+espera_checkout = Histograma('beauty_db_checkout_wait_seconds', 'Tempo esperando uma conexão livre no pool.', ())
+
+# Configuração do banco de dados com pool de conexões
 dbconfig = {
     "host": os.getenv('DB_HOST'),
+    "port": int(os.getenv('DB_PORT', 3306)),
     "user": os.getenv('DB_USER'),
     "password": os.getenv('DB_PASSWORD'),
-    "database": 'BEAUTY_LINK',
+    "database": os.getenv('DB_NAME', 'BEAUTY_LINK'),
     "connection_timeout": 10  # Timeout para conexões ociosas
 }
 
-# Ajuste do pool de conexões para evitar o excesso de conexões simultâneas
-connection_pool = pooling.MySQLConnectionPool(pool_name="mypool", pool_size=5, pool_reset_session=True, **dbconfig)
+# 'pool' mantém até DB_POOL_SIZE conexões; 'serverless' reaproveita uma única conexão, que é o que
+# uma instância de função de curta duração (Vercel) consegue usar, sem pagar por abrir várias
+DB_MODO = os.getenv('DB_MODO', 'serverless' if os.getenv('VERCEL') else 'pool')
+DB_POOL_SIZE = 1 if DB_MODO == 'serverless' else int(os.getenv('DB_POOL_SIZE', 5))
+DB_TIMEOUT_CHECKOUT = float(os.getenv('DB_TIMEOUT_CHECKOUT', 5))  # segundos esperando uma conexão livre
+DB_INTERVALO_PING = float(os.getenv('DB_INTERVALO_PING', 30))  # segundos ociosa antes de testar a conexão
+DB_IDADE_MAXIMA = float(os.getenv('DB_IDADE_MAXIMA', 1800))  # segundos até reabrir a conexão
+
+
+class BancoIndisponivel(Exception):
+    def __init__(self, mensagem, status=500):
+        super().__init__(mensagem)
+        self.status = status
+
+
+class PoolConexoes:
+    """Pool de conexões MySQL com fila de espera, validação e métricas.
+
+    Quando todas as conexões estão em uso, get_connection() espera até
+    `timeout_checkout` segundos por uma devolução em vez de falhar na hora.
+    As conexões são abertas sob demanda, testadas com ping quando ficaram
+    ociosas mais que `intervalo_ping` e reabertas após `idade_maxima`.
+    """
+
+    def __init__(self, config, tamanho, timeout_checkout, intervalo_ping, idade_maxima):
+        self.config = config
+        self.tamanho = tamanho
+        self.timeout_checkout = timeout_checkout
+        self.intervalo_ping = intervalo_ping
+        self.idade_maxima = idade_maxima
+        self._livres = deque()  # (conexão, criada_em, ultimo_uso)
+        self._total = 0
+        self._cond = threading.Condition()
+        self.em_uso = 0
+        self.checkouts = 0
+        self.espera_total = 0.0
+        self.espera_maxima = 0.0
+        self.timeouts = 0
+        self.erros = 0
+        self.criadas = 0
+        self.recicladas = 0
+
+    def get_connection(self):
+        inicio = time.monotonic()
+        with self._cond:
+            while not self._livres and self._total >= self.tamanho:
+                restante = inicio + self.timeout_checkout - time.monotonic()
+                if restante <= 0:
+                    self.timeouts += 1
+                    raise BancoIndisponivel('Tempo esgotado aguardando conexão com o banco de dados', 503)
+                self._cond.wait(restante)
+            if self._livres:
+                # A conexão usada por último é a que tem menos chance de ter caído
+                cnx, criada_em, ultimo_uso = self._livres.pop()
+            else:
+                cnx, criada_em, ultimo_uso = None, None, None
+                self._total += 1
+            self.em_uso += 1
+            espera = time.monotonic() - inicio
+            self.checkouts += 1
+            self.espera_total += espera
+            self.espera_maxima = max(self.espera_maxima, espera)
+        espera_checkout.observar(espera)
+
+        # Validação e abertura fora do lock: podem levar uma ida e volta ao servidor
+        try:
+            if cnx is not None and not self._valida(cnx, criada_em, ultimo_uso):
+                self._fechar(cnx)
+                cnx = None
+                with self._cond:
+                    self.recicladas += 1
+            if cnx is None:
+                cnx = mysql.connector.connect(**self.config)
+                criada_em = time.monotonic()
+                with self._cond:
+                    self.criadas += 1
+        except mysql.connector.Error as e:
+            with self._cond:
+                self._total -= 1
+                self.em_uso -= 1
+                self.erros += 1
+                self._cond.notify()
+            raise BancoIndisponivel(f'Erro ao conectar no banco de dados: {e}') from e
+        return ConexaoEmprestada(self, cnx, criada_em)
+
+    def _valida(self, cnx, criada_em, ultimo_uso):
+        agora = time.monotonic()
+        if agora - criada_em > self.idade_maxima:
+            return False
+        if agora - ultimo_uso > self.intervalo_ping:
+            try:
+                cnx.ping(reconnect=False)
+            except mysql.connector.Error:
+                return False
+        return True
+
+    def _fechar(self, cnx):
+        try:
+            cnx.close()
+        except mysql.connector.Error:
+            pass
+
+    def _devolver(self, cnx, criada_em):
+        try:
+            if cnx.unread_result:
+                cnx.consume_results()
+            if cnx.in_transaction:
+                cnx.rollback()
+            saudavel = True
+        except mysql.connector.Error:
+            saudavel = False
+            self._fechar(cnx)
+        with self._cond:
+            self.em_uso -= 1
+            if saudavel:
+                self._livres.append((cnx, criada_em, time.monotonic()))
+            else:
+                self._total -= 1
+                self.erros += 1
+            self._cond.notify()
+
+    def aquecer(self, quantidade):
+        # Abre até `quantidade` conexões de uma vez e as deixa livres no pool
+        conexoes = [self.get_connection() for _ in range(min(quantidade, self.tamanho))]
+        for connection in conexoes:
+            connection.close()
+
+    def estatisticas(self):
+        with self._cond:
+            return {
+                'tamanho': self.tamanho,
+                'abertas': self._total,
+                'em_uso': self.em_uso,
+                'checkouts': self.checkouts,
+                'espera_media_ms': round(self.espera_total / self.checkouts * 1000, 3) if self.checkouts else 0.0,
+                'espera_maxima_ms': round(self.espera_maxima * 1000, 3),
+                'timeouts': self.timeouts,
+                'erros': self.erros,
+                'criadas': self.criadas,
+                'recicladas': self.recicladas,
+            }
+
+
+class ConexaoEmprestada:
+    # Repassa tudo para a conexão real; close() devolve ao pool em vez de fechar
+
+    def __init__(self, pool, cnx, criada_em):
+        self._pool = pool
+        self._cnx = cnx
+        self._criada_em = criada_em
+
+    def __getattr__(self, nome):
+        return getattr(self._cnx, nome)
+
+    def cursor(self, *args, **kwargs):
+        return CursorMedido(self._cnx.cursor(*args, **kwargs))
+
+    def close(self):
+        if self._cnx is not None:
+            cnx, self._cnx = self._cnx, None
+            self._pool._devolver(cnx, self._criada_em)
+
+
+# O pool é criado na primeira requisição que usa o banco, não na importação: assim um cold
+# start não abre conexões antes de responder rotas que não precisam delas
+connection_pool = None
+_lock_pool = threading.Lock()
+
+
+def obter_pool():
+    global connection_pool
+    if connection_pool is None:
+        with _lock_pool:
+            if connection_pool is None:
+                connection_pool = PoolConexoes(dbconfig, DB_POOL_SIZE, DB_TIMEOUT_CHECKOUT, DB_INTERVALO_PING, DB_IDADE_MAXIMA)
+    return connection_pool
 
-# Função para obter conexão do pool
-def get_connection():
+
+def aquecer_banco():
+    # Abre as conexões antes da primeira requisição que precisa delas
     try:
-        return connection_pool.get_connection()
-    except mysql.connector.Error as e:
-        app.logger.error(f"Erro ao conectar no banco de dados: {e}")
+        obter_pool().aquecer(DB_POOL_SIZE)
+        app.logger.info("Conexões com o banco de dados aquecidas.")
+    except BancoIndisponivel as e:
+        app.logger.error(f"Erro ao aquecer conexões com o banco de dados: {e}")
+
+
+# Com `python server.py`, os workers de hash (spawn) reimportam este arquivo como __mp_main__
+if os.getenv('DB_AQUECER') == '1' and __name__ != '__mp_main__':
+    threading.Thread(target=aquecer_banco, name='aquecer-banco', daemon=True).start()
+
+
+def obter_conexao():
+    """Retira uma conexão do pool; quem recebe deve chamar close() para devolvê-la.
+
+    Lança BancoIndisponivel se não conseguir conexão (503 quando o pool ficou
+    cheio por mais de DB_TIMEOUT_CHECKOUT segundos).
+    """
+    return obter_pool().get_connection()
+
+
+@contextmanager
+def conexao():
+    # Conexão do pool devolvida ao sair do bloco; transações não confirmadas são desfeitas na devolução
+    connection = obter_conexao()
+    try:
+        yield connection
+    finally:
+        connection.close()
+
+
+@app.errorhandler(BancoIndisponivel)
+def banco_indisponivel(e):
+    app.logger.error(f"Falha ao conectar ao banco de dados: {e}")
+    resposta = jsonify({"message": "Falha ao conectar ao banco de dados"})
+    if e.status == 503:
+        resposta.headers['Retry-After'] = '1'
+    return resposta, e.status
+
+
+@app.before_request
+def iniciar_medicao():
+    g.inicio_requisicao = time.perf_counter()
+
+
+@app.after_request
+def registrar_latencia(resposta):
+    # Em respostas com streaming mede o tempo até o início do envio, não até o fim do corpo
+    inicio = g.pop('inicio_requisicao', None)
+    if inicio is not None:
+        rota = request.url_rule.rule if request.url_rule else 'desconhecida'
+        latencia_rotas.observar(time.perf_counter() - inicio, rota, request.method, str(resposta.status_code))
+    return resposta
+
+
+# Compressão de respostas grandes; brotli só se o pacote estiver instalado
+TAMANHO_MINIMO_COMPRESSAO = int(os.getenv('TAMANHO_MINIMO_COMPRESSAO', 1024))  # bytes
+NIVEL_GZIP = int(os.getenv('NIVEL_GZIP', 6))
+TIPOS_COMPRIMIVEIS = {'application/json', 'application/x-ndjson', 'text/plain', 'text/html'}
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+
+def escolher_codificacao():
+    codificacoes = request.accept_encodings
+    if brotli is not None and codificacoes['br']:
+        return 'br'
+    if codificacoes['gzip']:
+        return 'gzip'
+    return None
+
+
+def comprimir_stream(partes):
+    # Cada parte é enviada assim que chega: Z_SYNC_FLUSH fecha o bloco sem encerrar o gzip
+    compressor = zlib.compressobj(NIVEL_GZIP, zlib.DEFLATED, 31)
+    try:
+        for parte in partes:
+            if isinstance(parte, str):
+                parte = parte.encode('utf-8')
+            comprimido = compressor.compress(parte) + compressor.flush(zlib.Z_SYNC_FLUSH)
+            if comprimido:
+                yield comprimido
+        yield compressor.flush()
+    finally:
+        # Cliente desconectado no meio: o gerador original precisa devolver a conexão ao pool
+        if hasattr(partes, 'close'):
+            partes.close()
+
+
+@app.after_request
+def finalizar_resposta(resposta):
+    etag = g.pop('etag_agenda', None)
+    # Streaming não leva ETag: um erro no meio do corpo deixaria uma resposta truncada validável
+    if etag and resposta.status_code == 200 and not resposta.is_streamed:
+        resposta.set_etag(etag, weak=True)
+        resposta.headers['Cache-Control'] = 'no-cache'
+
+    if (resposta.status_code != 200 or resposta.mimetype not in TIPOS_COMPRIMIVEIS
+            or 'Content-Encoding' in resposta.headers):
+        return resposta
+    resposta.vary.add('Accept-Encoding')
+    codificacao = escolher_codificacao()
+    if codificacao is None:
+        return resposta
+
+    if resposta.is_streamed:
+        # Streaming só em gzip, que comprime parte a parte sem juntar o corpo na memória
+        if not request.accept_encodings['gzip']:
+            return resposta
+        resposta.response = comprimir_stream(resposta.response)
+        resposta.headers['Content-Encoding'] = 'gzip'
+        resposta.headers.pop('Content-Length', None)
+        return resposta
+
+    corpo = resposta.get_data()
+    if len(corpo) < TAMANHO_MINIMO_COMPRESSAO:
+        return resposta
+    if codificacao == 'br':
+        resposta.set_data(brotli.compress(corpo, quality=5))
+    else:
+        resposta.set_data(gzip.compress(corpo, NIVEL_GZIP))
+    resposta.headers['Content-Encoding'] = codificacao
+    return resposta
+
+# Paginação por cursor (keyset em DATA_ATENDIMENTO, ID_AGENDA) e streaming das listas de atendimentos
+LIMITE_MAXIMO_PAGINA = int(os.getenv('LIMITE_MAXIMO_PAGINA', 1000))
+TAMANHO_LOTE_STREAM = int(os.getenv('TAMANHO_LOTE_STREAM', 500))
+FORMATOS_STREAM = {'json': 'application/json', 'ndjson': 'application/x-ndjson'}
+
+# Filtro e ordenação usados por todas as consultas paginadas da AGENDA (alias A)
+FILTRO_CURSOR = ' AND (A.DATA_ATENDIMENTO > %s OR (A.DATA_ATENDIMENTO = %s AND A.ID_AGENDA > %s))'
+ORDEM_CURSOR = ' ORDER BY A.DATA_ATENDIMENTO ASC, A.ID_AGENDA ASC'
+COLUNA_CURSOR = "DATE_FORMAT(A.DATA_ATENDIMENTO, '%Y-%m-%d %H:%i:%s') AS CURSOR_DATA"
+
+
+def codificar_cursor(linha):
+    # O cursor é opaco para o cliente: base64 de "DATA_ATENDIMENTO|ID_AGENDA"
+    bruto = f"{linha['CURSOR_DATA']}|{linha['ID_AGENDA']}"
+    return base64.urlsafe_b64encode(bruto.encode('utf-8')).decode('ascii')
+
+
+def decodificar_cursor(cursor):
+    try:
+        data, id_agenda = base64.urlsafe_b64decode(cursor.encode('ascii')).decode('utf-8').rsplit('|', 1)
+        return data, int(id_agenda)
+    except (ValueError, UnicodeError) as e:
+        raise ValueError('Cursor inválido') from e
+
+
+def ler_paginacao():
+    """Lê limit, after e stream da query string.
+
+    Retorna None quando nenhum parâmetro foi enviado, para manter a resposta
+    original (lista completa). Lança ValueError para parâmetros inválidos.
+    """
+    limite = request.args.get('limit')
+    after = request.args.get('after')
+    stream = request.args.get('stream')
+
+    if limite is None and after is None and stream is None:
         return None
 
-# Configuração de logs para debug
-logging.basicConfig(level=logging.DEBUG)
+    if limite is not None:
+        try:
+            limite = int(limite)
+        except ValueError:
+            raise ValueError('Parâmetro limit deve ser um número inteiro')
+        if limite < 1 or limite > LIMITE_MAXIMO_PAGINA:
+            raise ValueError(f'Parâmetro limit deve estar entre 1 e {LIMITE_MAXIMO_PAGINA}')
+    elif after is not None and stream is None:
+        # Uma página sem limit explícito usa o tamanho máximo
+        limite = LIMITE_MAXIMO_PAGINA
+
+    if stream is not None and stream not in FORMATOS_STREAM:
+        raise ValueError(f"Parâmetro stream deve ser um de: {', '.join(FORMATOS_STREAM)}")
+
+    return {
+        'limite': limite,
+        'cursor': decodificar_cursor(after) if after else None,
+        'stream': stream,
+    }
+
+
+def montar_consulta_paginada(select, where, params, paginacao):
+    query = select + where
+    params = list(params)
+    if paginacao['cursor']:
+        data, id_agenda = paginacao['cursor']
+        query += FILTRO_CURSOR
+        params += [data, data, id_agenda]
+    query += ORDEM_CURSOR
+    if paginacao['limite']:
+        # Uma linha a mais indica se existe próxima página
+        query += ' LIMIT %s'
+        params.append(paginacao['limite'] + 1)
+    return query, tuple(params)
+
+
+def buscar_pagina(connection, query, params, limite, transformar=None):
+    with connection.cursor(dictionary=True) as cursor:
+        cursor.execute(query, params)
+        linhas = cursor.fetchall()
+
+    proximo_cursor = None
+    if len(linhas) > limite:
+        linhas = linhas[:limite]
+        proximo_cursor = codificar_cursor(linhas[-1])
+    for linha in linhas:
+        del linha['CURSOR_DATA']
+    if transformar:
+        linhas = transformar(linhas)
+    return jsonify({'atendimentos': linhas, 'proximo_cursor': proximo_cursor})
+
+
+def ler_em_lotes(cursor):
+    while True:
+        linhas = cursor.fetchmany(TAMANHO_LOTE_STREAM)
+        if not linhas:
+            return
+        yield linhas
+
+
+def transmitir_atendimentos(connection, query, params, paginacao, transformar=None):
+    """Envia as linhas conforme são lidas de um cursor não bufferizado.
+
+    A conexão passa a pertencer à resposta e volta ao pool quando ela é
+    fechada: fim do corpo, cliente desconectado ou HEAD, em que o gerador nem
+    chega a começar e o seu finally não roda. Enquanto o cursor estiver
+    aberto a conexão não aceita outras consultas, então `transformar` (aplicado
+    a cada lote) não pode consultar o banco.
+    """
+    formato = paginacao['stream']
+    limite = paginacao['limite']
+
+    def gerar():
+        cursor = connection.cursor(dictionary=True, buffered=False)
+        lidas = 0
+        enviadas = 0
+        ultima = None
+        proximo_cursor = None
+        try:
+            cursor.execute(query, params)
+            if formato == 'json':
+                yield '{"atendimentos": [' if limite else '['
+            for linhas in ler_em_lotes(cursor):
+                ha_mais = False
+                if limite and lidas + len(linhas) > limite:
+                    # Linha extra da consulta: existe próxima página
+                    linhas = linhas[:limite - lidas]
+                    ha_mais = True
+                lidas += len(linhas)
+                if linhas:
+                    ultima = {'CURSOR_DATA': linhas[-1]['CURSOR_DATA'], 'ID_AGENDA': linhas[-1]['ID_AGENDA']}
+                if ha_mais:
+                    proximo_cursor = codificar_cursor(ultima)
+                for linha in linhas:
+                    del linha['CURSOR_DATA']
+                if transformar:
+                    linhas = transformar(linhas)
+                for linha in linhas:
+                    if formato == 'json':
+                        yield (',' if enviadas else '') + app.json.dumps(linha)
+                    else:
+                        yield app.json.dumps(linha) + '\n'
+                    enviadas += 1
+                if ha_mais:
+                    break
+
+            if formato == 'json':
+                yield f'], "proximo_cursor": {app.json.dumps(proximo_cursor)}}}' if limite else ']'
+            elif proximo_cursor:
+                yield app.json.dumps({'proximo_cursor': proximo_cursor}) + '\n'
+        except mysql.connector.Error as e:
+            # O status HTTP já foi enviado; resta registrar e encerrar o corpo
+            app.logger.error(f"Erro ao transmitir atendimentos: {e}")
+        finally:
+            try:
+                # Um cursor não bufferizado precisa ser esgotado antes de voltar ao pool
+                if connection.unread_result:
+                    connection.consume_results()
+                cursor.close()
+            except mysql.connector.Error as e:
+                app.logger.warning(f"Erro ao liberar cursor do streaming: {e}")
+
+    resposta = Response(stream_with_context(gerar()), mimetype=FORMATOS_STREAM[formato])
+    # Roda depois de fechar o gerador, então o cursor já foi liberado
+    resposta.call_on_close(connection.close)
+    return resposta
+
+
+# Disponibilidade dos funcionários: cada atendimento ocupa DURACAO_ATENDIMENTO_MIN a partir de DATA_ATENDIMENTO
+DURACAO_ATENDIMENTO = timedelta(minutes=int(os.getenv('DURACAO_ATENDIMENTO_MIN', 60)))
+HORA_ABERTURA = int(os.getenv('HORA_ABERTURA', 9))
+HORA_FECHAMENTO = int(os.getenv('HORA_FECHAMENTO', 18))
+TTL_INDICE_AGENDA = int(os.getenv('TTL_INDICE_AGENDA', 60))  # segundos até recarregar o índice de um funcionário
+
+
+class IndiceAgenda:
+    """Índice em memória dos horários ocupados (não cancelados) por funcionário.
+
+    Para cada funcionário guarda os inícios dos atendimentos em uma lista
+    ordenada, o que permite verificar conflitos com busca binária. O índice é
+    carregado sob demanda, atualizado a cada escrita em /Ponto e
+    /CancelarAtendimento e recarregado após TTL_INDICE_AGENDA segundos, já que
+    outras instâncias do servidor também escrevem na AGENDA.
+    """
+
+    def __init__(self, duracao, ttl):
+        self.duracao = duracao
+        self.ttl = ttl
+        self._inicios = {}  # funcionario -> lista ordenada de inícios
+        self._ids = {}  # funcionario -> ID_AGENDA na mesma posição de _inicios
+        self._carregado_em = {}
+        self._lock = threading.Lock()
+
+    def garantir_carregado(self, connection, funcionario, forcar=False):
+        with self._lock:
+            carregado_em = self._carregado_em.get(funcionario)
+        if not forcar and carregado_em is not None and time.monotonic() - carregado_em < self.ttl:
+            return
+
+        with connection.cursor() as cursor:
+            cursor.execute('''
+                SELECT DATA_ATENDIMENTO, ID_AGENDA
+                FROM AGENDA
+                WHERE FK_ID_FUNCIONARIO = %s AND STATUS_AGENDAMENTO <> 'CANCELADO' AND DATA_ATENDIMENTO >= CURDATE()
+                ORDER BY DATA_ATENDIMENTO, ID_AGENDA
+            ''', (funcionario,))
+            linhas = cursor.fetchall()
+
+        with self._lock:
+            self._inicios[funcionario] = [linha[0] for linha in linhas]
+            self._ids[funcionario] = [linha[1] for linha in linhas]
+            self._carregado_em[funcionario] = time.monotonic()
+
+    def tem_conflito(self, funcionario, inicio):
+        with self._lock:
+            inicios = self._inicios.get(funcionario, [])
+            # Primeiro atendimento que começa depois de (inicio - duracao): conflita se começar antes de (inicio + duracao)
+            posicao = bisect.bisect_right(inicios, inicio - self.duracao)
+            return posicao < len(inicios) and inicios[posicao] < inicio + self.duracao
+
+    def adicionar(self, funcionario, inicio, id_agenda):
+        with self._lock:
+            if funcionario not in self._inicios:
+                # Ainda não carregado: será lido do banco na próxima consulta
+                return
+            posicao = bisect.bisect_right(self._inicios[funcionario], inicio)
+            self._inicios[funcionario].insert(posicao, inicio)
+            self._ids[funcionario].insert(posicao, id_agenda)
+
+    def remover(self, funcionario, inicio, id_agenda):
+        with self._lock:
+            inicios = self._inicios.get(funcionario)
+            if inicios is None:
+                return
+            ids = self._ids[funcionario]
+            posicao = bisect.bisect_left(inicios, inicio)
+            while posicao < len(inicios) and inicios[posicao] == inicio:
+                if ids[posicao] == id_agenda:
+                    del inicios[posicao]
+                    del ids[posicao]
+                    return
+                posicao += 1
+
+    def horarios_livres(self, funcionario, dia):
+        horario = datetime.combine(dia, datetime.min.time()) + timedelta(hours=HORA_ABERTURA)
+        fechamento = datetime.combine(dia, datetime.min.time()) + timedelta(hours=HORA_FECHAMENTO)
+        livres = []
+        while horario + self.duracao <= fechamento:
+            if not self.tem_conflito(funcionario, horario):
+                livres.append(horario)
+            horario += self.duracao
+        return livres
+
+
+indice_agenda = IndiceAgenda(DURACAO_ATENDIMENTO, TTL_INDICE_AGENDA)
+
+
+# Versão da AGENDA para ETag das listagens: com If-None-Match da versão atual a resposta é 304, sem consulta
+JANELA_ETAG_AGENDA = int(os.getenv('JANELA_ETAG_AGENDA', 30))  # segundos; 0 se só esta instância escreve na AGENDA
+
+
+class VersoesAgenda:
+    """Carimbo de versão da AGENDA, global e por cliente, incrementado a cada escrita.
+
+    A versão é da instância: escritas feitas por outras instâncias não a alteram.
+    Por isso o carimbo também muda a cada `janela` segundos, o que limita por
+    quanto tempo um cliente pode receber 304 com dados desatualizados.
+    """
+
+    def __init__(self, janela):
+        self.janela = janela
+        self._instancia = os.urandom(4).hex()  # ETags de outra instância (ou de antes de um restart) nunca batem
+        self._global = 0
+        self._clientes = {}  # cliente -> valor de _global na última escrita que o afetou
+        self._lock = threading.Lock()
+
+    def alterar(self, clientes):
+        with self._lock:
+            self._global += 1
+            for cliente in clientes:
+                self._clientes[str(cliente)] = self._global
+
+    def etag(self, cliente=None):
+        janela = int(time.time() // self.janela) if self.janela > 0 else 0
+        with self._lock:
+            versao = self._global if cliente is None else self._clientes.get(str(cliente), 0)
+        return f'{self._instancia}-{janela}-{versao}'
+
+
+versoes_agenda = VersoesAgenda(JANELA_ETAG_AGENDA)
+
+
+def responder_se_inalterado(etag):
+    # Deve ser chamada antes da consulta: uma escrita no meio só deixa o ETag mais antigo que os dados
+    g.etag_agenda = etag
+    if request.if_none_match.contains_weak(etag):
+        resposta = Response(status=304)
+        resposta.set_etag(etag, weak=True)
+        resposta.headers['Cache-Control'] = 'no-cache'
+        return resposta
+    return None
+
+
+# Feed de alterações da AGENDA (GET /Atendimento/stream): snapshot dos atendimentos CADASTRADO e depois só deltas
+TAMANHO_BUFFER_FEED = int(os.getenv('TAMANHO_BUFFER_FEED', 1000))  # eventos guardados para retomar com Last-Event-ID
+TTL_SNAPSHOT_FEED = int(os.getenv('TTL_SNAPSHOT_FEED', 60))  # segundos até reler o snapshot do banco
+INTERVALO_HEARTBEAT_FEED = int(os.getenv('INTERVALO_HEARTBEAT_FEED', 15))  # segundos entre comentários de keep-alive
+MAX_ASSINANTES_FEED = int(os.getenv('MAX_ASSINANTES_FEED', 100))  # cada assinante ocupa uma thread do worker
+RETRY_FEED_MS = int(os.getenv('RETRY_FEED_MS', 3000))
+
+CONSULTA_ATENDIMENTOS_CADASTRADOS = '''
+    SELECT ID_AGENDA, FK_ID_USUARIO_CLIENTE, DATE_FORMAT(DATA_ATENDIMENTO, '%Y-%m-%dT%H:%i:%sZ') AS DATA_ATENDIMENTO
+    FROM AGENDA
+    WHERE STATUS_AGENDAMENTO = 'CADASTRADO'
+'''
+
+
+class FeedAtendimentos:
+    """Estado e eventos do feed, compartilhados por todos os assinantes da instância.
+
+    O snapshot fica em memória e é mantido pelas próprias escritas (`criados`,
+    `cancelados`); o banco só é lido na primeira assinatura e depois a cada
+    `ttl` segundos, por uma única thread. Essa releitura também transforma em
+    eventos as alterações feitas por outras instâncias.
+
+    Os IDs de evento são consecutivos e começam no relógio (µs) da subida do
+    processo, então crescem também entre restarts. Um assinante retoma pelo
+    buffer se o Last-Event-ID ainda estiver nele; senão recebe novo snapshot.
+    """
+
+    def __init__(self, tamanho_buffer, ttl, max_assinantes):
+        self.ttl = ttl
+        self.max_assinantes = max_assinantes
+        self._cond = threading.Condition()
+        self._eventos = deque(maxlen=tamanho_buffer)  # (id, tipo, dados), IDs consecutivos
+        self._ultimo_id = time.time_ns() // 1000
+        self._estado = None  # ID_AGENDA -> linha como em GET /Atendimento; None até a primeira carga
+        self._carregado_em = 0
+        self._carregando = False
+        self.assinantes = 0
+        self.publicados = 0
+        self.recargas = 0
+
+    def _publicar(self, tipo, dados):
+        # Chamado com self._cond adquirido
+        self._ultimo_id += 1
+        self._eventos.append((self._ultimo_id, tipo, dados))
+        self.publicados += 1
+
+    def criados(self, linhas):
+        with self._cond:
+            for linha in linhas:
+                if self._estado is not None:
+                    self._estado[linha['ID_AGENDA']] = linha
+                self._publicar('criado', linha)
+            self._cond.notify_all()
+
+    def cancelados(self, ids):
+        with self._cond:
+            for id_agenda in ids:
+                if self._estado is not None:
+                    self._estado.pop(id_agenda, None)
+                self._publicar('cancelado', {'ID_AGENDA': id_agenda})
+            self._cond.notify_all()
+
+    def atualizar(self):
+        """Relê o snapshot se venceu. Só uma thread consulta; as outras seguem com o atual."""
+        with self._cond:
+            while self._carregando and self._estado is None:
+                self._cond.wait()
+            if self._carregando or (self._estado is not None and time.monotonic() - self._carregado_em < self.ttl):
+                return
+            self._carregando = True
+            desde = self._ultimo_id
+
+        linhas = None
+        try:
+            with conexao() as connection, connection.cursor(dictionary=True) as cursor:
+                cursor.execute(CONSULTA_ATENDIMENTOS_CADASTRADOS)
+                linhas = {linha['ID_AGENDA']: linha for linha in cursor.fetchall()}
+        finally:
+            with self._cond:
+                self._carregando = False
+                if linhas is not None:
+                    self._aplicar_recarga(linhas, desde)
+                self._cond.notify_all()
+
+    def _aplicar_recarga(self, linhas, desde):
+        # Escritas desta instância publicadas durante a consulta valem mais que o que ela leu
+        tocados = set()
+        for id_evento, tipo, dados in self._eventos:
+            if id_evento > desde:
+                tocados.add(dados['ID_AGENDA'])
+                if tipo == 'criado':
+                    linhas[dados['ID_AGENDA']] = dados
+                else:
+                    linhas.pop(dados['ID_AGENDA'], None)
+
+        if self._estado is not None:
+            # O que mudou sem passar por esta instância vira evento para os assinantes
+            for id_agenda, linha in linhas.items():
+                if id_agenda not in self._estado and id_agenda not in tocados:
+                    self._publicar('criado', linha)
+            for id_agenda in self._estado:
+                if id_agenda not in linhas and id_agenda not in tocados:
+                    self._publicar('cancelado', {'ID_AGENDA': id_agenda})
+
+        self._estado = linhas
+        self._carregado_em = time.monotonic()
+        self.recargas += 1
+
+    def _eventos_depois(self, ultimo_id):
+        # Chamado com self._cond adquirido; None se o buffer não cobre mais o intervalo
+        if ultimo_id is None or ultimo_id > self._ultimo_id:
+            return None
+        if ultimo_id == self._ultimo_id:
+            return []
+        if not self._eventos or self._eventos[0][0] > ultimo_id + 1:
+            return None
+        return list(itertools.islice(self._eventos, ultimo_id + 1 - self._eventos[0][0], None))
+
+    def retomar(self, ultimo_id):
+        with self._cond:
+            return self._eventos_depois(ultimo_id)
+
+    def aguardar(self, ultimo_id, timeout):
+        """Espera eventos depois de `ultimo_id`; [] no timeout, None se o assinante ficou para trás do buffer."""
+        with self._cond:
+            self._cond.wait_for(lambda: self._ultimo_id != ultimo_id, timeout)
+            return self._eventos_depois(ultimo_id)
+
+    def snapshot(self):
+        with self._cond:
+            return self._ultimo_id, list(self._estado.values())
+
+    def entrar(self):
+        with self._cond:
+            if self.assinantes >= self.max_assinantes:
+                return False
+            self.assinantes += 1
+            return True
+
+    def sair(self):
+        with self._cond:
+            self.assinantes -= 1
+
+
+feed_atendimentos = FeedAtendimentos(TAMANHO_BUFFER_FEED, TTL_SNAPSHOT_FEED, MAX_ASSINANTES_FEED)
+
+
+def evento_feed(id_evento, tipo, dados):
+    return f'id: {id_evento}\nevent: {tipo}\ndata: {app.json.dumps(dados)}\n\n'
+
+
+def linha_feed(id_agenda, cliente, inicio):
+    # Mesmo formato de GET /Atendimento
+    return {'ID_AGENDA': id_agenda, 'FK_ID_USUARIO_CLIENTE': cliente, 'DATA_ATENDIMENTO': inicio.strftime('%Y-%m-%dT%H:%M:%SZ')}
+
+
+# Cache de usuários: leituras de USUARIO são frequentes e os dados quase nunca mudam
+CAPACIDADE_CACHE_USUARIOS = int(os.getenv('CAPACIDADE_CACHE_USUARIOS', 5000))
+TTL_CACHE_USUARIOS = int(os.getenv('TTL_CACHE_USUARIOS', 300))  # segundos
+
+# Projeções explícitas de USUARIO: SENHA só é lida no login e nunca é enviada ao cliente
+COLUNAS_USUARIO = 'ID_USUARIO, NOME, LOGIN, EMAIL, FUNCIONARIO'
+COLUNAS_USUARIO_LOGIN = COLUNAS_USUARIO + ', SENHA'
+
+
+class CacheUsuarios:
+    """Cache LRU com TTL dos registros de USUARIO, indexado por ID_USUARIO e LOGIN.
+
+    Também guarda o mapa ID_USUARIO -> NOME dos funcionários, usado por
+    /MeusAtendimentos no lugar do JOIN com USUARIO.
+    """
+
+    def __init__(self, capacidade, ttl):
+        self.capacidade = capacidade
+        self.ttl = ttl
+        self._registros = OrderedDict()  # ID_USUARIO -> (expira_em, registro)
+        self._ids_por_login = {}
+        self._funcionarios = None  # (expira_em, {ID_USUARIO: NOME})
+        self._lock = threading.Lock()
+        self.acertos = 0
+        self.falhas = 0
+        self.remocoes = 0
+
+    def _obter(self, id_usuario):
+        entrada = self._registros.get(id_usuario)
+        if entrada is None:
+            self.falhas += 1
+            return None
+        expira_em, registro = entrada
+        if expira_em <= time.monotonic():
+            self._descartar(id_usuario)
+            self.falhas += 1
+            return None
+        self._registros.move_to_end(id_usuario)
+        self.acertos += 1
+        return registro
+
+    def _descartar(self, id_usuario):
+        _, registro = self._registros.pop(id_usuario)
+        if self._ids_por_login.get(registro['LOGIN']) == id_usuario:
+            del self._ids_por_login[registro['LOGIN']]
+
+    def obter_por_id(self, id_usuario):
+        with self._lock:
+            return self._obter(int(id_usuario))
+
+    def obter_por_login(self, login):
+        with self._lock:
+            id_usuario = self._ids_por_login.get(login)
+            if id_usuario is None:
+                self.falhas += 1
+                return None
+            return self._obter(id_usuario)
+
+    def guardar(self, registro):
+        with self._lock:
+            id_usuario = registro['ID_USUARIO']
+            if id_usuario in self._registros:
+                self._descartar(id_usuario)
+            self._registros[id_usuario] = (time.monotonic() + self.ttl, dict(registro))
+            self._ids_por_login[registro['LOGIN']] = id_usuario
+            while len(self._registros) > self.capacidade:
+                self._descartar(next(iter(self._registros)))
+                self.remocoes += 1
+
+    def invalidar(self, id_usuario=None, login=None):
+        with self._lock:
+            if login is not None and id_usuario is None:
+                id_usuario = self._ids_por_login.get(login)
+            if id_usuario is not None and int(id_usuario) in self._registros:
+                self._descartar(int(id_usuario))
+            self._funcionarios = None
+
+    def nomes_funcionarios(self):
+        with self._lock:
+            if self._funcionarios and self._funcionarios[0] > time.monotonic():
+                self.acertos += 1
+                return self._funcionarios[1]
+            self.falhas += 1
+
+        # Só o mapa de nomes: sem SENHA, estas linhas não podem ir para o cache por usuário usado no /Login
+        with conexao() as connection, connection.cursor(dictionary=True) as cursor:
+            cursor.execute('SELECT ID_USUARIO, NOME FROM USUARIO WHERE FUNCIONARIO = 1')
+            funcionarios = cursor.fetchall()
+
+        nomes = {funcionario['ID_USUARIO']: funcionario['NOME'] for funcionario in funcionarios}
+        with self._lock:
+            self._funcionarios = (time.monotonic() + self.ttl, nomes)
+        return nomes
+
+    def estatisticas(self):
+        with self._lock:
+            return {
+                'acertos': self.acertos,
+                'falhas': self.falhas,
+                'remocoes': self.remocoes,
+                'tamanho': len(self._registros),
+            }
+
+
+cache_usuarios = CacheUsuarios(CAPACIDADE_CACHE_USUARIOS, TTL_CACHE_USUARIOS)
+
+
+def dados_publicos(usuario):
+    return {coluna: valor for coluna, valor in usuario.items() if coluna != 'SENHA'}
+
+
+def buscar_usuario(connection, coluna, valor):
+    # coluna vem sempre do código (ID_USUARIO ou LOGIN), nunca do cliente
+    with connection.cursor(dictionary=True) as cursor:
+        cursor.execute(f'SELECT {COLUNAS_USUARIO_LOGIN} FROM USUARIO WHERE {coluna} = %s', (valor,))
+        usuario = cursor.fetchone()
+    if usuario:
+        cache_usuarios.guardar(usuario)
+    return usuario
+
+
+# Hash de senhas fora da thread da requisição: o KDF é caro e bloquearia as demais rotas do worker
+METODO_HASH_SENHA = os.getenv('METODO_HASH_SENHA', 'pbkdf2:sha256:600000')
+HASH_WORKERS = int(os.getenv('HASH_WORKERS', os.cpu_count() or 1))  # 0 executa na própria thread da requisição
+HASH_MAX_PENDENTES = int(os.getenv('HASH_MAX_PENDENTES', max(HASH_WORKERS, 1) * 4))
+HASH_TIMEOUT_FILA = float(os.getenv('HASH_TIMEOUT_FILA', 2))  # segundos esperando vaga antes de responder 503
+
+
+class HashSobrecarregado(Exception):
+    pass
+
+
+class ServicoHash:
+    """Executa generate/check_password_hash em um pool de processos limitado.
+
+    No máximo `max_pendentes` hashes ficam em execução ou na fila; quem não
+    consegue vaga em `timeout_fila` segundos recebe HashSobrecarregado (503).
+    Onde não é possível criar processos (alguns ambientes serverless) o pool
+    usa threads, já que o PBKDF2 do hashlib libera o GIL.
+    """
+
+    def __init__(self, workers, max_pendentes, timeout_fila):
+        self.workers = workers
+        self.timeout_fila = timeout_fila
+        self._vagas = threading.BoundedSemaphore(max_pendentes)
+        self._pool = None
+        self._lock = threading.Lock()
+
+    def _executor(self):
+        with self._lock:
+            if self._pool is None:
+                try:
+                    # spawn e não fork: o processo já tem threads (logs, WSGI, aquecimento) e um
+                    # fork copiaria locks presos por elas
+                    self._pool = ProcessPoolExecutor(max_workers=self.workers,
+                                                     mp_context=multiprocessing.get_context('spawn'))
+                except (OSError, NotImplementedError) as e:
+                    app.logger.warning(f"Pool de processos indisponível para hash de senhas, usando threads: {e}")
+                    self._pool = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix='hash')
+            return self._pool
+
+    def _descartar(self, pool):
+        # Só troca o pool se outra thread ainda não trocou
+        with self._lock:
+            if self._pool is pool:
+                self._pool = None
+        pool.shutdown(wait=False)
+
+    def _executar(self, funcao, *args):
+        if not self._vagas.acquire(timeout=self.timeout_fila):
+            raise HashSobrecarregado()
+        try:
+            if self.workers <= 0:
+                return funcao(*args)
+            # Um worker que morre (OOM, sinal) quebra o pool inteiro: recria e tenta mais uma vez
+            for _ in range(2):
+                pool = self._executor()
+                try:
+                    return pool.submit(funcao, *args).result()
+                except BrokenProcessPool as e:
+                    app.logger.error(f"Pool de processos de hash quebrado, recriando: {e}")
+                    self._descartar(pool)
+            raise HashSobrecarregado()
+        finally:
+            self._vagas.release()
+
+    def gerar(self, senha):
+        return self._executar(generate_password_hash, senha, METODO_HASH_SENHA)
+
+    def verificar(self, senha_hash, senha):
+        return self._executar(check_password_hash, senha_hash, senha)
+
+    def precisa_rehash(self, senha_hash):
+        # O prefixo do hash do werkzeug ("pbkdf2:sha256:600000$...") registra os parâmetros usados
+        return senha_hash.split('$', 1)[0] != METODO_HASH_SENHA
+
+
+servico_hash = ServicoHash(HASH_WORKERS, HASH_MAX_PENDENTES, HASH_TIMEOUT_FILA)
+
+
+def resposta_hash_sobrecarregado():
+    app.logger.warning("Fila de hash de senhas cheia.")
+    resposta = jsonify({'message': 'Servidor ocupado, tente novamente em instantes'})
+    resposta.headers['Retry-After'] = '1'
+    return resposta, 503
+
+
+def atualizar_hash_senha(usuario, senha):
+    # Recalcula o hash com os parâmetros atuais; uma falha aqui não impede o login
+    try:
+        novo_hash = servico_hash.gerar(senha)
+    except HashSobrecarregado:
+        return
+
+    try:
+        with conexao() as connection, connection.cursor() as cursor:
+            cursor.execute('UPDATE USUARIO SET SENHA = %s WHERE ID_USUARIO = %s AND SENHA = %s',
+                           (novo_hash, usuario['ID_USUARIO'], usuario['SENHA']))
+            connection.commit()
+        cache_usuarios.invalidar(id_usuario=usuario['ID_USUARIO'])
+        app.logger.info("Hash de senha atualizado para os parâmetros atuais.")
+    except (BancoIndisponivel, mysql.connector.Error) as e:
+        app.logger.warning(f"Erro ao atualizar hash de senha: {e}")
+
+
+def nomear_funcionarios(linhas, nomes):
+    # Troca FK_ID_FUNCIONARIO pelo nome; atendimentos sem funcionário válido ficam de fora, como no antigo JOIN
+    resultado = []
+    for linha in linhas:
+        nome = nomes.get(linha.pop('FK_ID_FUNCIONARIO'))
+        if nome is not None:
+            linha['FUNCIONARIO'] = nome
+            resultado.append(linha)
+    return resultado
+
+
+def ler_id(valor):
+    # Só inteiros ou strings de dígitos: o MySQL converteria '1.0' ou '1abc' para 1 sem reclamar
+    if isinstance(valor, int) and not isinstance(valor, bool):
+        return valor
+    if isinstance(valor, str) and valor.isascii() and valor.isdigit():
+        return int(valor)
+    raise ValueError(f'ID inválido: {valor!r}')
+
+
+def ler_data_atendimento(valor):
+    # Aceita 'YYYY-MM-DD HH:MM[:SS]' e ISO 8601 ('2024-05-10T14:00:00.000Z'), sempre sem fuso
+    try:
+        return datetime.fromisoformat(str(valor).replace('Z', '')).replace(tzinfo=None, second=0, microsecond=0)
+    except ValueError:
+        raise ValueError('Data de atendimento inválida')
+
+
+TAMANHO_MAXIMO_LOTE = int(os.getenv('TAMANHO_MAXIMO_LOTE', 100))
+
+ERRO_CHAVE_ESTRANGEIRA = 1452  # ER_NO_REFERENCED_ROW_2: funcionário ou cliente que não existe em USUARIO
+
+COMANDO_INSERIR_ATENDIMENTO = '''
+    INSERT INTO AGENDA (TIPO_SERVICO, DATA_ATENDIMENTO, DATA_MARCACAO, STATUS_AGENDAMENTO, OBSERVACAO, FK_ID_FUNCIONARIO, FK_ID_USUARIO_CLIENTE)
+    VALUES (%s, %s, %s, %s, %s, %s, %s)
+'''
+
+
+def validar_atendimento(dados):
+    """Valida os campos de um atendimento e devolve os valores na ordem de COMANDO_INSERIR_ATENDIMENTO.
+
+    Lança ValueError com a mensagem para o cliente.
+    """
+    tipo_servico = dados.get('tipo_servico')
+    data_atendimento = dados.get('data_atendimento')
+    data_marcacao = dados.get('data_marcacao')
+    status_agendamento = dados.get('status_agendamento')
+    observacao = dados.get('observacao')
+    fk_id_funcionario = dados.get('fk_id_funcionario')
+    fk_id_usuario_cliente = dados.get('fk_id_usuario_cliente')
+
+    if not all([tipo_servico, data_atendimento, data_marcacao, status_agendamento, fk_id_funcionario, fk_id_usuario_cliente]):
+        raise ValueError('Todos os campos são obrigatórios')
+
+    inicio = ler_data_atendimento(data_atendimento)
+    try:
+        fk_id_funcionario = ler_id(fk_id_funcionario)
+    except ValueError:
+        raise ValueError('Funcionário inválido')
+    try:
+        fk_id_usuario_cliente = ler_id(fk_id_usuario_cliente)
+    except ValueError:
+        raise ValueError('Cliente inválido')
+
+    return (tipo_servico, inicio, data_marcacao, status_agendamento, observacao, fk_id_funcionario, fk_id_usuario_cliente)
+
+
+def bloquear_funcionarios(cursor, funcionarios):
+    # Bloqueia os funcionários até o commit: agendamentos concorrentes (mesmo em outras
+    # instâncias) para eles são serializados e a verificação de horário é definitiva.
+    # A ordem fixa evita deadlock entre lotes com funcionários em comum.
+    funcionarios = sorted(funcionarios)
+    marcadores = ', '.join(['%s'] * len(funcionarios))
+    cursor.execute(f'SELECT ID_USUARIO FROM USUARIO WHERE ID_USUARIO IN ({marcadores}) ORDER BY ID_USUARIO FOR UPDATE', funcionarios)
+    # Devolve os que existem: os demais não têm linha para bloquear e o INSERT falharia na chave estrangeira
+    return {linha[0] for linha in cursor.fetchall()}
+
+
+def usuarios_existentes(cursor, ids):
+    ids = list(ids)
+    marcadores = ', '.join(['%s'] * len(ids))
+    cursor.execute(f'SELECT ID_USUARIO FROM USUARIO WHERE ID_USUARIO IN ({marcadores})', ids)
+    return {linha[0] for linha in cursor.fetchall()}
+
+
+def horario_ocupado(cursor, funcionario, inicio):
+    cursor.execute('''
+        SELECT ID_AGENDA
+        FROM AGENDA
+        WHERE FK_ID_FUNCIONARIO = %s AND STATUS_AGENDAMENTO <> 'CANCELADO'
+          AND DATA_ATENDIMENTO > %s AND DATA_ATENDIMENTO < %s
+        LIMIT 1
+        FOR UPDATE
+    ''', (funcionario, inicio - DURACAO_ATENDIMENTO, inicio + DURACAO_ATENDIMENTO))
+    return cursor.fetchone() is not None
+
+
+def horarios_ocupados(cursor, funcionarios, inicio, fim):
+    """Inícios dos atendimentos não cancelados entre `inicio` e `fim` (exclusivos), em ordem, por funcionário."""
+    funcionarios = sorted(funcionarios)
+    marcadores = ', '.join(['%s'] * len(funcionarios))
+    cursor.execute(f'''
+        SELECT FK_ID_FUNCIONARIO, DATA_ATENDIMENTO
+        FROM AGENDA
+        WHERE FK_ID_FUNCIONARIO IN ({marcadores}) AND STATUS_AGENDAMENTO <> 'CANCELADO'
+          AND DATA_ATENDIMENTO > %s AND DATA_ATENDIMENTO < %s
+        ORDER BY FK_ID_FUNCIONARIO, DATA_ATENDIMENTO
+        FOR UPDATE
+    ''', [*funcionarios, inicio, fim])
+    ocupados = {funcionario: [] for funcionario in funcionarios}
+    for funcionario, data_atendimento in cursor.fetchall():
+        ocupados[funcionario].append(data_atendimento)
+    return ocupados
+
+
+def conflita(inicios, inicio):
+    # Mesma regra de horario_ocupado sobre uma lista ordenada: algum início a menos de DURACAO_ATENDIMENTO
+    posicao = bisect.bisect_right(inicios, inicio - DURACAO_ATENDIMENTO)
+    return posicao < len(inicios) and inicios[posicao] < inicio + DURACAO_ATENDIMENTO
+
 
 @app.route('/', methods=['GET'])
 @cross_origin()
@@ -42,8 +1298,6 @@ def home():
     return "Hello, World!"
 
 
-from werkzeug.security import generate_password_hash
-
 @app.route('/Cadastro', methods=['POST'])
 @cross_origin()
 def cadastrar_usuario():
@@ -57,32 +1311,36 @@ def cadastrar_usuario():
         app.logger.warning("Todos os campos são obrigatórios.")
         return jsonify({'message': 'Todos os campos são obrigatórios'}), 400
 
-    connection = get_connection()
-    if not connection:
-        app.logger.error("Falha ao conectar ao banco de dados.")
-        return jsonify({"message": "Falha ao conectar ao banco de dados"}), 500
-
     try:
-        with connection.cursor() as cursor:
-            # Criptografando a senha antes de armazená-la no banco de dados
-            senha_hash = generate_password_hash(senha)
-            comando = '''
-                INSERT INTO USUARIO (NOME, LOGIN, EMAIL, SENHA)
-                VALUES (%s, %s, %s, %s)
-            '''
-            valores = (nome, usuario, email, senha_hash)  # Armazenando a senha criptografada
-            cursor.execute(comando, valores)
-            connection.commit()
+        # Criptografando a senha antes de armazená-la no banco de dados
+        senha_hash = servico_hash.gerar(senha)
+    except HashSobrecarregado:
+        return resposta_hash_sobrecarregado()
 
-        app.logger.info("Usuário cadastrado com sucesso.")
-        return jsonify({'message': 'Usuário cadastrado com sucesso'}), 201
-    except mysql.connector.Error as e:
-        app.logger.error(f"Erro ao cadastrar usuário: {e}")
-        connection.rollback()
-        return jsonify({'message': 'Falha ao cadastrar usuário', 'error': str(e)}), 500
-    finally:
-        if connection.is_connected():
-            connection.close()
+    with conexao() as connection:
+        try:
+            with connection.cursor() as cursor:
+                comando = '''
+                    INSERT INTO USUARIO (NOME, LOGIN, EMAIL, SENHA)
+                    VALUES (%s, %s, %s, %s)
+                '''
+                valores = (nome, usuario, email, senha_hash)  # Armazenando a senha criptografada
+                cursor.execute(comando, valores)
+                connection.commit()
+
+            cache_usuarios.invalidar(login=usuario)
+
+            app.logger.info("Usuário cadastrado com sucesso.")
+            return jsonify({'message': 'Usuário cadastrado com sucesso'}), 201
+        except mysql.connector.IntegrityError as e:
+            # LOGIN é único (migrations/0002_indices_usuario.sql)
+            app.logger.warning(f"Login já cadastrado: {e}")
+            connection.rollback()
+            return jsonify({'message': 'Nome de usuário já cadastrado'}), 409
+        except mysql.connector.Error as e:
+            app.logger.error(f"Erro ao cadastrar usuário: {e}")
+            connection.rollback()
+            return jsonify({'message': 'Falha ao cadastrar usuário', 'error': str(e)}), 500
 
 
 
@@ -94,26 +1352,22 @@ def get_usuario():
         app.logger.warning("ID de usuário não fornecido.")
         return jsonify({'message': 'ID de usuário não fornecido'}), 400
 
-    connection = get_connection()
-    if not connection:
-        app.logger.error("Falha ao conectar ao banco de dados.")
-        return jsonify({"message": "Falha ao conectar ao banco de dados"}), 500
-
     try:
-        with connection.cursor(dictionary=True) as cursor:
-            start_time = time.time()
-            cursor.execute('SELECT * FROM USUARIO WHERE ID_USUARIO = %s', (usuario_id,))
-            usuario = cursor.fetchone()
-            app.logger.info(f"Tempo de execução de get_usuario: {time.time() - start_time} segundos")
-    except Exception as e:
-        app.logger.error(f"Erro ao buscar usuário: {e}")
-        return jsonify({"message": "Erro ao buscar usuário", "error": str(e)}), 500
-    finally:
-        if connection.is_connected():
-            connection.close()
+        usuario = cache_usuarios.obter_por_id(usuario_id)
+    except ValueError:
+        app.logger.warning("ID de usuário inválido.")
+        return jsonify({'message': 'ID de usuário inválido'}), 400
+
+    if not usuario:
+        with conexao() as connection:
+            try:
+                usuario = buscar_usuario(connection, 'ID_USUARIO', usuario_id)
+            except Exception as e:
+                app.logger.error(f"Erro ao buscar usuário: {e}")
+                return jsonify({"message": "Erro ao buscar usuário", "error": str(e)}), 500
 
     if usuario:
-        return jsonify(usuario)
+        return jsonify(dados_publicos(usuario))
     else:
         app.logger.warning("Usuário não encontrado.")
         return jsonify({'message': 'Usuário não encontrado'}), 404
@@ -125,30 +1379,30 @@ def login():
     usuario = dados['usuario']
     senha = dados['senha']
 
-    connection = get_connection()
-    if not connection:
-        app.logger.error("Falha ao conectar ao banco de dados.")
-        return jsonify({"message": "Falha ao conectar ao banco de dados"}), 500
+    usuario_existente = cache_usuarios.obter_por_login(usuario)
+    if not usuario_existente or 'SENHA' not in usuario_existente:
+        with conexao() as connection:
+            try:
+                usuario_existente = buscar_usuario(connection, 'LOGIN', usuario)
+            except Exception as e:
+                app.logger.error(f"Erro no login: {e}")
+                return jsonify({"message": "Erro no login", "error": str(e)}), 500
 
     try:
-        with connection.cursor(dictionary=True) as cursor:
-            cursor.execute('SELECT * FROM USUARIO WHERE LOGIN = %s', (usuario,))
-            usuario_existente = cursor.fetchone()
-
-        if usuario_existente and check_password_hash(usuario_existente['SENHA'], senha):
-            return jsonify({
-                'message': 'Login bem-sucedido',
-                'id_usuario': usuario_existente['ID_USUARIO']
-            })
-        else:
-            app.logger.warning("Nome de usuário ou senha inválidos.")
-            return jsonify({'message': 'Nome de usuário ou senha inválidos'}), 401
-    except Exception as e:
-        app.logger.error(f"Erro no login: {e}")
-        return jsonify({"message": "Erro no login", "error": str(e)}), 500
-    finally:
-        if connection.is_connected():
-            connection.close()
+        senha_correta = bool(usuario_existente) and servico_hash.verificar(usuario_existente['SENHA'], senha)
+    except HashSobrecarregado:
+        return resposta_hash_sobrecarregado()
+
+    if senha_correta:
+        if servico_hash.precisa_rehash(usuario_existente['SENHA']):
+            atualizar_hash_senha(usuario_existente, senha)
+        return jsonify({
+            'message': 'Login bem-sucedido',
+            'id_usuario': usuario_existente['ID_USUARIO']
+        })
+    else:
+        app.logger.warning("Nome de usuário ou senha inválidos.")
+        return jsonify({'message': 'Nome de usuário ou senha inválidos'}), 401
 
 @app.route('/CancelarAtendimento', methods=['PUT'])
 @cross_origin()
@@ -159,31 +1413,104 @@ def cancelar_atendimento():
     if not id_atendimento:
         app.logger.warning("ID do atendimento não fornecido.")
         return jsonify({'message': 'ID do atendimento não fornecido'}), 400
+    try:
+        id_atendimento = ler_id(id_atendimento)
+    except ValueError:
+        app.logger.warning("ID do atendimento inválido.")
+        return jsonify({'message': 'ID de atendimento inválido'}), 400
 
-    connection = get_connection()
-    if not connection:
-        app.logger.error("Falha ao conectar ao banco de dados.")
-        return jsonify({"message": "Falha ao conectar ao banco de dados"}), 500
+    with conexao() as connection:
+        try:
+            with connection.cursor() as cursor:
+                cursor.execute('SELECT FK_ID_FUNCIONARIO, DATA_ATENDIMENTO, FK_ID_USUARIO_CLIENTE FROM AGENDA WHERE ID_AGENDA = %s', (id_atendimento,))
+                atendimento = cursor.fetchone()
 
-    try:
-        with connection.cursor() as cursor:
-            # Atualizando o status do atendimento para "CANCELADO"
-            comando = '''
-                UPDATE AGENDA
-                SET STATUS = 'CANCELADO'
-                WHERE ID_AGENDA = %s
-            '''
-            cursor.execute(comando, (id_atendimento,))
-            connection.commit()
+                # Atualizando o status do atendimento para "CANCELADO"
+                comando = '''
+                    UPDATE AGENDA
+                    SET STATUS_AGENDAMENTO = 'CANCELADO'
+                    WHERE ID_AGENDA = %s
+                '''
+                cursor.execute(comando, (id_atendimento,))
+                connection.commit()
+
+            if atendimento:
+                # Libera o horário no índice de disponibilidade
+                indice_agenda.remover(atendimento[0], atendimento[1], id_atendimento)
+                versoes_agenda.alterar([atendimento[2]])
+                feed_atendimentos.cancelados([id_atendimento])
+
+            app.logger.info("Atendimento cancelado com sucesso.")
+            return jsonify({'message': 'Atendimento cancelado com sucesso'}), 200
+        except mysql.connector.Error as e:
+            app.logger.error(f"Erro ao cancelar atendimento: {e}")
+            return jsonify({'message': 'Erro ao cancelar atendimento', 'error': str(e)}), 500
 
-        app.logger.info("Atendimento cancelado com sucesso.")
-        return jsonify({'message': 'Atendimento cancelado com sucesso'}), 200
-    except mysql.connector.Error as e:
-        app.logger.error(f"Erro ao cancelar atendimento: {e}")
-        return jsonify({'message': 'Erro ao cancelar atendimento', 'error': str(e)}), 500
-    finally:
-        if connection.is_connected():
-            connection.close()
+
+
+@app.route('/CancelarAtendimento/lote', methods=['PUT'])
+@cross_origin()
+def cancelar_atendimentos_lote():
+    dados = request.get_json()
+    ids = dados.get('ids') if isinstance(dados, dict) else dados
+
+    if not isinstance(ids, list) or not ids:
+        app.logger.warning("Lista de IDs de atendimento não fornecida.")
+        return jsonify({'message': 'Lista de IDs de atendimento não fornecida'}), 400
+    if len(ids) > TAMANHO_MAXIMO_LOTE:
+        app.logger.warning("Lote de cancelamentos acima do limite.")
+        return jsonify({'message': f'No máximo {TAMANHO_MAXIMO_LOTE} atendimentos por lote'}), 413
+
+    resultados = [None] * len(ids)
+    validos = []  # (indice, id), inclusive repetidos: cada posição da entrada tem seu resultado
+    for indice, id_atendimento in enumerate(ids):
+        try:
+            validos.append((indice, ler_id(id_atendimento)))
+        except ValueError:
+            resultados[indice] = {'indice': indice, 'id': id_atendimento, 'status': 'erro', 'message': 'ID de atendimento inválido'}
+
+    if validos:
+        unicos = sorted({id_atendimento for _, id_atendimento in validos})
+        with conexao() as connection:
+            marcadores = ', '.join(['%s'] * len(unicos))
+            try:
+                with connection.cursor() as cursor:
+                    cursor.execute(f'''
+                        SELECT ID_AGENDA, FK_ID_FUNCIONARIO, DATA_ATENDIMENTO, FK_ID_USUARIO_CLIENTE
+                        FROM AGENDA
+                        WHERE ID_AGENDA IN ({marcadores})
+                        FOR UPDATE
+                    ''', unicos)
+                    atendimentos = {linha[0]: linha for linha in cursor.fetchall()}
+                    if atendimentos:
+                        cursor.execute(f'''
+                            UPDATE AGENDA
+                            SET STATUS_AGENDAMENTO = 'CANCELADO'
+                            WHERE ID_AGENDA IN ({', '.join(['%s'] * len(atendimentos))})
+                        ''', list(atendimentos))
+                    connection.commit()
+            except mysql.connector.Error as e:
+                app.logger.error(f"Erro ao cancelar lote de atendimentos: {e}")
+                connection.rollback()
+                return jsonify({'message': 'Erro ao cancelar atendimentos', 'error': str(e)}), 500
+
+        for atendimento in atendimentos.values():
+            indice_agenda.remover(atendimento[1], atendimento[2], atendimento[0])
+        for indice, id_atendimento in validos:
+            if id_atendimento in atendimentos:
+                resultados[indice] = {'indice': indice, 'id': id_atendimento, 'status': 'cancelado'}
+            else:
+                resultados[indice] = {'indice': indice, 'id': id_atendimento, 'status': 'erro', 'message': 'Atendimento não encontrado'}
+        if atendimentos:
+            versoes_agenda.alterar({atendimento[3] for atendimento in atendimentos.values()})
+            feed_atendimentos.cancelados(list(atendimentos))
+
+    # Um ID repetido conta uma vez em 'cancelados', mas cada posição entra no status
+    cancelados = len({resultado['id'] for resultado in resultados if resultado['status'] == 'cancelado'})
+    sucessos = sum(1 for resultado in resultados if resultado['status'] == 'cancelado')
+    app.logger.info(f"Lote de cancelamentos processado: {cancelados} atendimento(s) cancelado(s), {sucessos} de {len(ids)} itens.")
+    status = 200 if sucessos == len(ids) else (207 if sucessos else 400)
+    return jsonify({'cancelados': cancelados, 'resultados': resultados}), status
 
 
 
@@ -192,43 +1519,136 @@ def cancelar_atendimento():
 def cadastrar_atendimento():
     dados = request.get_json()
 
-    tipo_servico = dados.get('tipo_servico')
-    data_atendimento = dados.get('data_atendimento')
-    data_marcacao = dados.get('data_marcacao')
-    status_agendamento = dados.get('status_agendamento')
-    observacao = dados.get('observacao')
-    fk_id_funcionario = dados.get('fk_id_funcionario')
-    fk_id_usuario_cliente = dados.get('fk_id_usuario_cliente')
+    try:
+        valores = validar_atendimento(dados)
+    except ValueError as e:
+        app.logger.warning(f"{e}.")
+        app.logger.info(f"Data de atendimento recebida: {dados.get('data_atendimento')}")
+        return jsonify({'message': str(e)}), 400
+    inicio, fk_id_funcionario = valores[1], valores[5]
 
-    if not all([tipo_servico, data_atendimento, data_marcacao, status_agendamento, fk_id_funcionario, fk_id_usuario_cliente]):
-        app.logger.warning("Todos os campos são obrigatórios.")
-        app.logger.info(f"Data de atendimento recebida: {data_atendimento}")
-        return jsonify({'message': 'Todos os campos são obrigatórios'}), 400
+    with conexao() as connection:
+        try:
+            # Verificação rápida no índice em memória, sem abrir transação. O índice pode estar até
+            # TTL_INDICE_AGENDA segundos atrasado (cancelamento em outra instância), então um conflito
+            # nele é só indício: relê o funcionário do banco antes de recusar
+            indice_agenda.garantir_carregado(connection, fk_id_funcionario)
+            if indice_agenda.tem_conflito(fk_id_funcionario, inicio):
+                indice_agenda.garantir_carregado(connection, fk_id_funcionario, forcar=True)
+                if indice_agenda.tem_conflito(fk_id_funcionario, inicio):
+                    app.logger.warning("Horário indisponível para o funcionário.")
+                    return jsonify({'message': 'Horário indisponível para o funcionário'}), 409
 
-    connection = get_connection()
-    if not connection:
-        app.logger.error("Falha ao conectar ao banco de dados.")
-        return jsonify({"message": "Falha ao conectar ao banco de dados"}), 500
+            with connection.cursor() as cursor:
+                bloquear_funcionarios(cursor, [fk_id_funcionario])
+                if horario_ocupado(cursor, fk_id_funcionario, inicio):
+                    connection.rollback()
+                    app.logger.warning("Horário indisponível para o funcionário.")
+                    return jsonify({'message': 'Horário indisponível para o funcionário'}), 409
 
-    try:
-        with connection.cursor() as cursor:
-            comando = '''
-                INSERT INTO AGENDA (TIPO_SERVICO, DATA_ATENDIMENTO, DATA_MARCACAO, STATUS_AGENDAMENTO, OBSERVACAO, FK_ID_FUNCIONARIO, FK_ID_USUARIO_CLIENTE)
-                VALUES (%s, %s, %s, %s, %s, %s, %s)
-            '''
-            valores = (tipo_servico, data_atendimento, data_marcacao, status_agendamento, observacao, fk_id_funcionario, fk_id_usuario_cliente)
-            cursor.execute(comando, valores)
-            connection.commit()
+                cursor.execute(COMANDO_INSERIR_ATENDIMENTO, valores)
+                id_agenda = cursor.lastrowid
+                connection.commit()
 
-        app.logger.info("Atendimento cadastrado com sucesso.")
-        return jsonify({'message': 'Atendimento cadastrado com sucesso'}), 201
-    except mysql.connector.Error as e:
-        app.logger.error(f"Erro ao cadastrar atendimento: {e}")
-        connection.rollback()
-        return jsonify({'message': 'Falha ao cadastrar atendimento', 'error': str(e)}), 500
-    finally:
-        if connection.is_connected():
-            connection.close()
+            indice_agenda.adicionar(fk_id_funcionario, inicio, id_agenda)
+            versoes_agenda.alterar([valores[6]])
+            if valores[3] == 'CADASTRADO':
+                feed_atendimentos.criados([linha_feed(id_agenda, valores[6], inicio)])
+
+            app.logger.info("Atendimento cadastrado com sucesso.")
+            return jsonify({'message': 'Atendimento cadastrado com sucesso'}), 201
+        except mysql.connector.IntegrityError as e:
+            connection.rollback()
+            if e.errno != ERRO_CHAVE_ESTRANGEIRA:
+                app.logger.error(f"Erro ao cadastrar atendimento: {e}")
+                return jsonify({'message': 'Falha ao cadastrar atendimento', 'error': str(e)}), 500
+            app.logger.warning(f"Funcionário ou cliente inexistente: {e}")
+            return jsonify({'message': 'Funcionário ou cliente inexistente'}), 400
+        except mysql.connector.Error as e:
+            app.logger.error(f"Erro ao cadastrar atendimento: {e}")
+            connection.rollback()
+            return jsonify({'message': 'Falha ao cadastrar atendimento', 'error': str(e)}), 500
+
+@app.route('/Ponto/lote', methods=['POST'])
+@cross_origin()
+def cadastrar_atendimentos_lote():
+    dados = request.get_json()
+    itens = dados.get('atendimentos') if isinstance(dados, dict) else dados
+
+    if not isinstance(itens, list) or not itens:
+        app.logger.warning("Lista de atendimentos não fornecida.")
+        return jsonify({'message': 'Lista de atendimentos não fornecida'}), 400
+    if len(itens) > TAMANHO_MAXIMO_LOTE:
+        app.logger.warning("Lote de atendimentos acima do limite.")
+        return jsonify({'message': f'No máximo {TAMANHO_MAXIMO_LOTE} atendimentos por lote'}), 413
+
+    resultados = [None] * len(itens)
+    validos = []  # (indice, valores)
+    for indice, item in enumerate(itens):
+        try:
+            valores = validar_atendimento(item if isinstance(item, dict) else {})
+        except ValueError as e:
+            resultados[indice] = {'indice': indice, 'status': 'erro', 'message': str(e)}
+            continue
+        # Dois itens do próprio lote também não podem ocupar o mesmo horário
+        if any(v[5] == valores[5] and abs(v[1] - valores[1]) < DURACAO_ATENDIMENTO for _, v in validos):
+            resultados[indice] = {'indice': indice, 'status': 'erro', 'message': 'Horário em conflito com outro item do lote'}
+            continue
+        validos.append((indice, valores))
+
+    if validos:
+        with conexao() as connection:
+            try:
+                with connection.cursor() as cursor:
+                    funcionarios = bloquear_funcionarios(cursor, {valores[5] for _, valores in validos})
+                    clientes = usuarios_existentes(cursor, {valores[6] for _, valores in validos})
+                    # Uma consulta para o lote inteiro em vez de um horario_ocupado por item
+                    inicios = [valores[1] for _, valores in validos]
+                    ocupados = horarios_ocupados(cursor, {valores[5] for _, valores in validos},
+                                                 min(inicios) - DURACAO_ATENDIMENTO, max(inicios) + DURACAO_ATENDIMENTO)
+                    livres = []
+                    for indice, valores in validos:
+                        # Um item com funcionário ou cliente inexistente faria o executemany inteiro falhar
+                        if valores[5] not in funcionarios or valores[6] not in clientes:
+                            resultados[indice] = {'indice': indice, 'status': 'erro', 'message': 'Funcionário ou cliente inexistente'}
+                        elif conflita(ocupados[valores[5]], valores[1]):
+                            resultados[indice] = {'indice': indice, 'status': 'erro', 'message': 'Horário indisponível para o funcionário'}
+                        else:
+                            livres.append((indice, valores))
+
+                    if livres:
+                        cursor.executemany(COMANDO_INSERIR_ATENDIMENTO, [valores for _, valores in livres])
+                        # IDs de um INSERT de várias linhas não são garantidamente consecutivos; como os
+                        # funcionários estão bloqueados, (funcionário, horário) identifica cada linha nova
+                        filtro = ' OR '.join(['(FK_ID_FUNCIONARIO = %s AND DATA_ATENDIMENTO = %s)'] * len(livres))
+                        cursor.execute(f'''
+                            SELECT ID_AGENDA, FK_ID_FUNCIONARIO, DATA_ATENDIMENTO
+                            FROM AGENDA
+                            WHERE STATUS_AGENDAMENTO <> 'CANCELADO' AND ({filtro})
+                        ''', [campo for _, valores in livres for campo in (valores[5], valores[1])])
+                        ids = {(linha[1], linha[2]): linha[0] for linha in cursor.fetchall()}
+                    connection.commit()
+            except mysql.connector.Error as e:
+                app.logger.error(f"Erro ao cadastrar lote de atendimentos: {e}")
+                connection.rollback()
+                return jsonify({'message': 'Falha ao cadastrar atendimentos', 'error': str(e)}), 500
+
+        for indice, valores in livres:
+            id_agenda = ids.get((valores[5], valores[1]))
+            indice_agenda.adicionar(valores[5], valores[1], id_agenda)
+            resultados[indice] = {'indice': indice, 'status': 'criado', 'id_agenda': id_agenda}
+        if livres:
+            versoes_agenda.alterar({valores[6] for _, valores in livres})
+            feed_atendimentos.criados([
+                linha_feed(resultados[indice]['id_agenda'], valores[6], valores[1])
+                for indice, valores in livres
+                if valores[3] == 'CADASTRADO' and resultados[indice]['id_agenda'] is not None
+            ])
+
+    criados = sum(1 for resultado in resultados if resultado['status'] == 'criado')
+    app.logger.info(f"Lote de atendimentos processado: {criados} de {len(itens)} criados.")
+    status = 201 if criados == len(itens) else (207 if criados else 400)
+    return jsonify({'criados': criados, 'resultados': resultados}), status
 
 @app.route('/MeusAtendimentos', methods=['GET'])
 @cross_origin()
@@ -238,40 +1658,72 @@ def get_meus_atendimentos():
         app.logger.warning("ID de usuário não fornecido.")
         return jsonify({'message': 'ID de usuário não fornecido'}), 400
 
-    connection = get_connection()
-    if not connection:
-        app.logger.error("Falha ao conectar ao banco de dados.")
-        return jsonify({"message": "Falha ao conectar ao banco de dados"}), 500
-
     try:
-        with connection.cursor(dictionary=True) as cursor:
-            # Atualizando a consulta para buscar o nome do funcionário da tabela USUARIO
-            query = '''
-                SELECT 
-                    A.ID_AGENDA, 
-                    A.TIPO_SERVICO, 
-                    DATE_FORMAT(A.DATA_ATENDIMENTO, '%Y-%m-%d %H:%i') AS DATA_ATENDIMENTO, 
-                    A.STATUS_AGENDAMENTO,
-                    U.NOME AS FUNCIONARIO  -- Buscando o nome do funcionário da tabela USUARIO
-                FROM AGENDA A
-                JOIN USUARIO U ON A.FK_ID_FUNCIONARIO = U.ID_USUARIO  -- Ligando a FK_ID_FUNCIONARIO com a tabela USUARIO
-                WHERE A.FK_ID_USUARIO_CLIENTE = %s AND U.FUNCIONARIO = 1  -- Verificando se o usuário é funcionário
-                ORDER BY A.DATA_ATENDIMENTO ASC
-            '''
-            cursor.execute(query, (usuario_id,))
-            atendimentos = cursor.fetchall()
+        paginacao = ler_paginacao()
+    except ValueError as e:
+        app.logger.warning(f"Parâmetros de paginação inválidos: {e}")
+        return jsonify({'message': str(e)}), 400
 
-        if atendimentos:
-            return jsonify(atendimentos)
-        else:
-            app.logger.info("Nenhum atendimento encontrado para o usuário.")
-            return jsonify([])
-    except Exception as e:
-        app.logger.error(f"Erro ao buscar atendimentos: {e}")
+    inalterado = responder_se_inalterado(versoes_agenda.etag(usuario_id))
+    if inalterado:
+        return inalterado
+
+    try:
+        # Nome dos funcionários vem do cache, sem JOIN com USUARIO a cada requisição
+        nomes = cache_usuarios.nomes_funcionarios()
+    except mysql.connector.Error as e:
+        app.logger.error(f"Erro ao buscar funcionários: {e}")
         return jsonify({"message": "Erro ao buscar atendimentos", "error": str(e)}), 500
-    finally:
-        if connection.is_connected():
-            connection.close()
+
+    def transformar(linhas):
+        return nomear_funcionarios(linhas, nomes)
+
+    if paginacao:
+        select = f'''
+            SELECT
+                A.ID_AGENDA,
+                A.TIPO_SERVICO,
+                DATE_FORMAT(A.DATA_ATENDIMENTO, '%Y-%m-%d %H:%i') AS DATA_ATENDIMENTO,
+                A.STATUS_AGENDAMENTO,
+                A.FK_ID_FUNCIONARIO,
+                {COLUNA_CURSOR}
+            FROM AGENDA A
+        '''
+        where = ' WHERE A.FK_ID_USUARIO_CLIENTE = %s'
+        query, params = montar_consulta_paginada(select, where, (usuario_id,), paginacao)
+        if paginacao['stream']:
+            # A conexão fica com o streaming e volta ao pool quando a resposta termina
+            return transmitir_atendimentos(obter_conexao(), query, params, paginacao, transformar)
+
+    with conexao() as connection:
+        try:
+            if paginacao:
+                return buscar_pagina(connection, query, params, paginacao['limite'], transformar)
+
+            with connection.cursor(dictionary=True) as cursor:
+                # Ordena pela coluna (A.), não pelo alias formatado: assim a ordem vem do índice, sem filesort
+                query = '''
+                    SELECT 
+                        A.ID_AGENDA, 
+                        A.TIPO_SERVICO, 
+                        DATE_FORMAT(A.DATA_ATENDIMENTO, '%Y-%m-%d %H:%i') AS DATA_ATENDIMENTO, 
+                        A.STATUS_AGENDAMENTO,
+                        A.FK_ID_FUNCIONARIO
+                    FROM AGENDA A
+                    WHERE A.FK_ID_USUARIO_CLIENTE = %s
+                    ORDER BY A.DATA_ATENDIMENTO ASC, A.ID_AGENDA ASC
+                '''
+                cursor.execute(query, (usuario_id,))
+                atendimentos = transformar(cursor.fetchall())
+
+            if atendimentos:
+                return jsonify(atendimentos)
+            else:
+                app.logger.info("Nenhum atendimento encontrado para o usuário.")
+                return jsonify([])
+        except Exception as e:
+            app.logger.error(f"Erro ao buscar atendimentos: {e}")
+            return jsonify({"message": "Erro ao buscar atendimentos", "error": str(e)}), 500
 
 
 
@@ -280,31 +1732,158 @@ def get_meus_atendimentos():
 @cross_origin()
 def get_atendimentos():
     try:
-        connection = get_connection()
-        if not connection:
-            app.logger.error("Falha ao conectar ao banco de dados.")
-            return jsonify({"message": "Falha ao conectar ao banco de dados"}), 500
-
-        with connection.cursor(dictionary=True) as cursor:
-            query = '''
-                SELECT ID_AGENDA, FK_ID_USUARIO_CLIENTE, DATE_FORMAT(DATA_ATENDIMENTO, '%Y-%m-%dT%H:%i:%sZ') AS DATA_ATENDIMENTO
-                FROM AGENDA
-                WHERE STATUS_AGENDAMENTO = 'CADASTRADO'
-            '''
-            cursor.execute(query)
-            atendimentos = cursor.fetchall()
+        paginacao = ler_paginacao()
+    except ValueError as e:
+        app.logger.warning(f"Parâmetros de paginação inválidos: {e}")
+        return jsonify({'message': str(e)}), 400
 
-        if atendimentos:
-            return jsonify(atendimentos)
-        else:
-            app.logger.info("Nenhum atendimento encontrado.")
-            return jsonify([])
-    except Exception as e:
-        app.logger.error(f"Erro ao buscar atendimentos: {e}")
+    inalterado = responder_se_inalterado(versoes_agenda.etag())
+    if inalterado:
+        return inalterado
+
+    if paginacao:
+        select = f'''
+            SELECT A.ID_AGENDA, A.FK_ID_USUARIO_CLIENTE, DATE_FORMAT(A.DATA_ATENDIMENTO, '%Y-%m-%dT%H:%i:%sZ') AS DATA_ATENDIMENTO,
+                {COLUNA_CURSOR}
+            FROM AGENDA A
+        '''
+        where = " WHERE A.STATUS_AGENDAMENTO = 'CADASTRADO'"
+        query, params = montar_consulta_paginada(select, where, (), paginacao)
+        if paginacao['stream']:
+            # A conexão fica com o streaming e volta ao pool quando a resposta termina
+            return transmitir_atendimentos(obter_conexao(), query, params, paginacao)
+
+    with conexao() as connection:
+        try:
+            if paginacao:
+                return buscar_pagina(connection, query, params, paginacao['limite'])
+
+            with connection.cursor(dictionary=True) as cursor:
+                cursor.execute(CONSULTA_ATENDIMENTOS_CADASTRADOS)
+                atendimentos = cursor.fetchall()
+
+            if atendimentos:
+                return jsonify(atendimentos)
+            else:
+                app.logger.info("Nenhum atendimento encontrado.")
+                return jsonify([])
+        except Exception as e:
+            app.logger.error(f"Erro ao buscar atendimentos: {e}")
+            return jsonify({"message": "Erro ao processar a solicitação", "error": str(e)}), 500
+
+
+@app.route('/Atendimento/stream', methods=['GET'])
+@cross_origin()
+def stream_atendimentos():
+    # EventSource reenvia o último ID no cabeçalho; lastEventId na query permite retomar em clientes sem ele
+    ultimo_id = request.headers.get('Last-Event-ID') or request.args.get('lastEventId')
+    try:
+        ultimo_id = int(ultimo_id) if ultimo_id else None
+    except ValueError:
+        ultimo_id = None
+
+    try:
+        # Snapshot compartilhado: só a primeira assinatura (ou a primeira depois do TTL) consulta o banco
+        feed_atendimentos.atualizar()
+    except mysql.connector.Error as e:
+        app.logger.error(f"Erro ao carregar atendimentos do feed: {e}")
         return jsonify({"message": "Erro ao processar a solicitação", "error": str(e)}), 500
-    finally:
-        if connection.is_connected():
-            connection.close()
+
+    if not feed_atendimentos.entrar():
+        app.logger.warning("Limite de assinantes do feed atingido.")
+        return jsonify({'message': 'Muitas conexões abertas no feed, tente novamente'}), 503, {'Retry-After': '5'}
+    eventos = feed_atendimentos.retomar(ultimo_id)
+
+    def gerar():
+        yield f'retry: {RETRY_FEED_MS}\n\n'
+        pendentes = eventos
+        ultimo = ultimo_id
+        while True:
+            if pendentes is None:
+                # Primeira conexão, Last-Event-ID fora do buffer ou assinante lento: recomeça do snapshot
+                ultimo, linhas = feed_atendimentos.snapshot()
+                yield evento_feed(ultimo, 'snapshot', linhas)
+            elif pendentes:
+                for id_evento, tipo, dados in pendentes:
+                    yield evento_feed(id_evento, tipo, dados)
+                ultimo = pendentes[-1][0]
+            else:
+                # Mantém proxies com a conexão aberta e detecta cliente desconectado
+                yield ': ping\n\n'
+
+            try:
+                feed_atendimentos.atualizar()
+            except (BancoIndisponivel, mysql.connector.Error) as e:
+                app.logger.warning(f"Falha ao reler atendimentos do feed: {e}")
+            pendentes = feed_atendimentos.aguardar(ultimo, INTERVALO_HEARTBEAT_FEED)
+
+    resposta = Response(stream_with_context(gerar()), mimetype='text/event-stream',
+                        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+    # Libera a vaga quando a resposta é fechada, inclusive em HEAD, em que o gerador nem começa
+    resposta.call_on_close(feed_atendimentos.sair)
+    return resposta
+
+
+@app.route('/Disponibilidade', methods=['GET'])
+@cross_origin()
+def get_disponibilidade():
+    funcionario = request.args.get('funcionario')
+    dia = request.args.get('dia')
+
+    if not funcionario or not dia:
+        app.logger.warning("Funcionário e dia são obrigatórios.")
+        return jsonify({'message': 'Funcionário e dia são obrigatórios'}), 400
+
+    try:
+        funcionario = int(funcionario)
+        dia = datetime.strptime(dia, '%Y-%m-%d').date()
+    except ValueError:
+        app.logger.warning("Funcionário ou dia inválido.")
+        return jsonify({'message': 'Funcionário ou dia inválido (use dia=YYYY-MM-DD)'}), 400
+
+    with conexao() as connection:
+        try:
+            indice_agenda.garantir_carregado(connection, funcionario)
+        except mysql.connector.Error as e:
+            app.logger.error(f"Erro ao buscar disponibilidade: {e}")
+            return jsonify({"message": "Erro ao buscar disponibilidade", "error": str(e)}), 500
+
+    # O índice só guarda atendimentos a partir de hoje
+    livres = indice_agenda.horarios_livres(funcionario, dia) if dia >= datetime.now().date() else []
+    return jsonify({
+        'funcionario': funcionario,
+        'dia': dia.isoformat(),
+        'duracao_minutos': int(DURACAO_ATENDIMENTO.total_seconds() // 60),
+        'horarios_livres': [horario.strftime('%Y-%m-%d %H:%M') for horario in livres],
+    })
+
+
+@app.route('/metrics', methods=['GET'])
+def metrics():
+    linhas = latencia_rotas.exportar() + latencia_consultas.exportar() + erros_consultas.exportar()
+    linhas += espera_checkout.exportar()
+
+    # O pool só existe depois da primeira requisição que usa o banco
+    if connection_pool is not None:
+        pool = connection_pool.estatisticas()
+        linhas += exportar_valor('beauty_db_pool_in_use', 'Conexões emprestadas no momento.', 'gauge', pool['em_uso'])
+        linhas += exportar_valor('beauty_db_pool_open', 'Conexões abertas pelo pool.', 'gauge', pool['abertas'])
+        linhas += exportar_valor('beauty_db_pool_checkouts_total', 'Conexões retiradas do pool.', 'counter', pool['checkouts'])
+        linhas += exportar_valor('beauty_db_pool_timeouts_total', 'Retiradas que esgotaram o tempo de espera.', 'counter', pool['timeouts'])
+        linhas += exportar_valor('beauty_db_pool_errors_total', 'Falhas ao abrir ou devolver conexões.', 'counter', pool['erros'])
+        linhas += exportar_valor('beauty_db_pool_recycled_total', 'Conexões reabertas por idade ou ping.', 'counter', pool['recicladas'])
+
+    cache = cache_usuarios.estatisticas()
+    linhas += exportar_valor('beauty_user_cache_hits_total', 'Acertos do cache de usuários.', 'counter', cache['acertos'])
+    linhas += exportar_valor('beauty_user_cache_misses_total', 'Falhas do cache de usuários.', 'counter', cache['falhas'])
+    linhas += exportar_valor('beauty_user_cache_evictions_total', 'Remoções por LRU no cache de usuários.', 'counter', cache['remocoes'])
+    linhas += exportar_valor('beauty_user_cache_size', 'Usuários no cache.', 'gauge', cache['tamanho'])
+
+    linhas += exportar_valor('beauty_feed_subscribers', 'Assinantes conectados em /Atendimento/stream.', 'gauge', feed_atendimentos.assinantes)
+    linhas += exportar_valor('beauty_feed_events_total', 'Eventos publicados no feed de atendimentos.', 'counter', feed_atendimentos.publicados)
+    linhas += exportar_valor('beauty_feed_reloads_total', 'Releituras do snapshot do feed no banco.', 'counter', feed_atendimentos.recargas)
+
+    return Response('\n'.join(linhas) + '\n', mimetype='text/plain; version=0.0.4')
 
 
 if __name__ == '__main__':